@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2006, Mathieu Fenniak
+# Copyright (c) 2013, Jean Schurger <jean@schurger.org>
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Caching of decoded stream data.
+"""
+
+import threading
+from collections import OrderedDict
+
+# Default memory budget of a decoded stream cache, in bytes.
+DEFAULT_BUDGET = 64 * 1024 * 1024
+
+
+##
+# Least-recently-used cache of decoded stream data, bounded by the total size
+# of the data it holds.  Each {@link #PdfFileReader PdfFileReader} has one, so
+# that only the most recently used streams of a document keep a decoded copy
+# in memory; evicted streams are transparently decoded again when needed.
+# The cache can be shared between threads.
+#
+# @param budget Maximum number of bytes of decoded data to hold.  Streams
+#               larger than the budget are never cached.
+class DecodedStreamCache(object):
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytesEvicted = 0
+        # id(stream) -> (stream, data), least recently used first.  Holding
+        # the stream guarantees that its id is not reused while cached.
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    ##
+    # Returns the decoded data of a stream, or None if it is not cached.
+    def get(self, stream):
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(id(stream), None)
+            if entry is None:
+                self.misses += 1
+                return None
+            # move to the most recently used end
+            self._entries[id(stream)] = entry
+            self.hits += 1
+            return entry[1]
+        finally:
+            self._lock.release()
+
+    ##
+    # Stores the decoded data of a stream, evicting the least recently used
+    # entries as needed to stay within the budget.
+    def put(self, stream, data):
+        self._lock.acquire()
+        try:
+            old = self._entries.pop(id(stream), None)
+            if old is not None:
+                self.size -= len(old[1])
+            if len(data) > self.budget:
+                return
+            self._entries[id(stream)] = (stream, data)
+            self.size += len(data)
+            self._evict(self.budget)
+        finally:
+            self._lock.release()
+
+    ##
+    # Changes the budget, evicting entries if the new one is smaller.
+    def setBudget(self, budget):
+        self._lock.acquire()
+        try:
+            self.budget = budget
+            self._evict(budget)
+        finally:
+            self._lock.release()
+
+    ##
+    # Drops all the cached data.
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._evict(0)
+        finally:
+            self._lock.release()
+
+    def _evict(self, budget):
+        while self.size > budget:
+            key = iter(self._entries).next()
+            stream, data = self._entries.pop(key)
+            self.size -= len(data)
+            self.evictions += 1
+            self.bytesEvicted += len(data)
+
+    ##
+    # Returns the cache statistics: number of cached streams, bytes held,
+    # budget, hits, misses, evictions and bytes evicted.
+    # @return A dictionary.
+    def getStats(self):
+        return {"streams": len(self._entries),
+                "size": self.size,
+                "budget": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytesEvicted": self.bytesEvicted}
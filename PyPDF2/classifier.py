@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2006, Mathieu Fenniak
+# Copyright (c) 2013, Jean Schurger <jean@schurger.org>
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Classification of pages by what they draw, e.g. to find blank pages.
+
+Pages are classified from the cheapest evidence first: a page without
+content is blank without decoding anything, and the operators of its content
+streams are scanned without reading their operands, stopping as soon as the
+class of the page is known.
+"""
+
+from content_stream import iterOperators
+from generic import IndirectObject, DictionaryObject, ArrayObject
+from text import _objectKey
+
+##
+# The page draws nothing.
+BLANK = "blank"
+##
+# The page only draws images, e.g. a scanned page.
+IMAGE_ONLY = "image-only"
+##
+# The page shows text, and may draw anything else.
+TEXT = "text"
+##
+# The page paints paths or shadings, and may draw images, but no text.
+VECTOR = "vector"
+
+# What is drawn, as flags; the class of a page is that of its highest flag.
+_IMAGE = 1
+_VECTOR = 2
+_TEXT = 4
+
+_textOperators = frozenset(["Tj", "TJ", "'", '"'])
+_paintOperators = frozenset(["S", "s", "f", "F", "f*", "B", "B*", "b", "b*",
+                             "sh"])
+
+
+def _pageClass(flags):
+    if flags & _TEXT:
+        return TEXT
+    if flags & _VECTOR:
+        return VECTOR
+    if flags & _IMAGE:
+        return IMAGE_ONLY
+    return BLANK
+
+
+def _isEmpty(stream):
+    # Tells an unfiltered stream holding only whitespace without decoding it.
+    # An encoded empty stream is not empty, e.g. 8 bytes once Flate encoded,
+    # and is told by scanning it.
+    if "/Filter" in stream:
+        return False
+    data = getattr(stream, "_data", None)
+    return data is not None and not data.strip()
+
+
+def _contentParts(page):
+    # The content streams of a page, as stored: unlike
+    # PageObject._getContentParts, the pending transformations of the page,
+    # which draw nothing, are not applied to it.
+    contents = page.raw_get("/Contents").getObject()
+    if isinstance(contents, ArrayObject):
+        return [part.getObject() for part in contents]
+    return [contents]
+
+
+##
+# Classifies pages as {@link #BLANK BLANK}, {@link #IMAGE_ONLY IMAGE_ONLY},
+# {@link #TEXT TEXT} or {@link #VECTOR VECTOR} pages.  A classifier keeps
+# what it found about the form XObjects it scanned, so that classifying the
+# pages of a document with a single classifier scans each form once.
+class PageClassifier(object):
+    def __init__(self):
+        # object key -> (form, flags)
+        self._forms = {}
+
+    ##
+    # Returns the class of a page.
+    #
+    # @param page The {@link #PageObject PageObject}.
+    # @return One of BLANK, IMAGE_ONLY, TEXT and VECTOR.
+    def classify(self, page):
+        if "/Contents" not in page:
+            return BLANK
+        parts = [part for part in _contentParts(page) if not _isEmpty(part)]
+        if not parts:
+            return BLANK
+        return _pageClass(self._scan(parts, page.get("/Resources"), ()))
+
+    # Returns the flags of what a list of content streams draws, stopping
+    # early once the class they give is known.
+    def _scan(self, parts, resources, forms):
+        if resources is None:
+            resources = DictionaryObject()
+        resources = resources.getObject()
+        xobjects = resources.get("/XObject", DictionaryObject()).getObject()
+        # text is only shown with a font, by this content or by a form
+        textShown = "/Font" in resources or any(
+            xobject.getObject().get("/Subtype") == "/Form"
+            for xobject in xobjects.values())
+        flags = 0
+        for part in parts:
+            for operator, name in iterOperators(part.getData()):
+                if operator in _textOperators:
+                    return flags | _TEXT
+                elif operator in _paintOperators:
+                    flags |= _VECTOR
+                elif operator == "BI":
+                    flags |= _IMAGE
+                elif operator == "Do" and name in xobjects:
+                    flags |= self._scanXObject(xobjects.raw_get(name),
+                                               resources, forms)
+                    if flags & _TEXT:
+                        return flags
+                else:
+                    continue
+                if flags & _VECTOR and not textShown:
+                    return flags
+        return flags
+
+    def _scanXObject(self, xobject, resources, forms):
+        key = _objectKey(xobject)
+        cached = self._forms.get(key)
+        if cached is not None and (cached[0] is xobject or
+                                   isinstance(xobject, IndirectObject)):
+            return cached[1]
+        stream = xobject.getObject()
+        subtype = stream.get("/Subtype")
+        if subtype == "/Image":
+            return _IMAGE
+        if subtype != "/Form" or key in forms:
+            return 0
+        # a form without resources uses those of the page
+        formResources = stream.get("/Resources", resources)
+        flags = 0
+        if not _isEmpty(stream):
+            flags = self._scan([stream], formResources, forms + (key,))
+        self._forms[key] = (xobject, flags)
+        return flags
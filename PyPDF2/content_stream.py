@@ -0,0 +1,584 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2006, Mathieu Fenniak
+# Copyright (c) 2013, Jean Schurger <jean@schurger.org>
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Lexer for page content streams.
+
+Content streams are parsed from their decoded bytes with compiled regular
+expressions instead of the generic object readers of the generic module,
+which read their input one byte at a time.  The objects produced are the same
+as those the generic readers produce, except that form feed and NUL separate
+tokens, and that octal escapes of one or two digits in strings do not drop the
+character following them.
+"""
+
+import binascii
+import re
+
+from utils import PdfReadError, PdfStreamError, hexStr
+from generic import DictionaryObject, ArrayObject, NameObject, NullObject
+from generic import BooleanObject, NumberObject, FloatObject, IndirectObject
+from generic import createStringObject
+
+# Characters which end a name or an operator.
+_regular = r"[^\s()<>\[\]{}/%]*"
+
+# Next token at the top level of a content stream, after whitespace.
+_tokenRe = re.compile(
+    r"[ \t\n\r\x0c\x00]*(?:"
+    r"([A-Za-z'\"]" + _regular + r")|"  # 1: operator
+    r"([0-9][-+.0-9]*)|"                # 2: number or indirect reference
+    r"([-+.][-+.0-9]*)|"                # 3: number
+    r"(/" + _regular + r")|"            # 4: name
+    r"(%[^\r\n]*[\r\n]?)|"              # 5: comment
+    r"([^ \t\n\r\x0c\x00]))")           # 6: anything else
+
+_nameRe = re.compile(r"/" + _regular)
+_numberRe = re.compile(r"[-+.0-9]*")
+_indirectRe = re.compile(r"(\d+)\s(\d+)\sR[^a-zA-Z]")
+_commentRe = re.compile(r"%[^\r\n]*[\r\n]?")
+# whitespace skipped by utils.readNonWhitespace, and by str.isspace
+_nonWhitespaceRe = re.compile(r"[ \t\n\r]*")
+_spaceRe = re.compile(r"\s*")
+_stringSpecialRe = re.compile(r"[()\\]")
+_octalRe = re.compile(r"[0-9]{1,3}")
+_hexDigitsRe = re.compile(r"[0-9A-Fa-f]*$")
+
+_escapes = {"n": "\n", "r": "\r", "t": "\t", "b": "\b", "f": "\f",
+            "(": "(", ")": ")", "\\": "\\"}
+
+
+##
+# Parses the decoded data of a content stream, appending (operands, operator)
+# pairs to a list of operations.  Inline images are appended as
+# ({"settings": dictionary, "data": image data}, "INLINE IMAGE") pairs.
+#
+# @param data The decoded content stream data.
+# @param operations The list the operations are appended to.
+# @param operands Operands read before the data, when it is a part of a
+#                 content stream split in several streams.
+# @param pdf The PDF file indirect references are resolved in, if any.
+# @return The operands left at the end of the data, which the following
+#         part of the content stream applies its first operator to.
+def parseContentStream(data, operations, operands=None, pdf=None):
+    if operands is None:
+        operands = []
+    return _parse(data, operations, operands, pdf, True)[0]
+
+
+##
+# Parses the decoded data of a content stream given in chunks, e.g. by
+# StreamObject.iterData, like {@link #parseContentStream parseContentStream}.
+# The operations are appended as the chunks arrive, so that the whole decoded
+# data is not held in memory, and a consumer stopping the parsing, e.g. by
+# raising an exception from the append method of operations, stops the
+# decoding as well.  A token cut by the end of a chunk is parsed with the
+# following chunks.
+#
+# @param chunks An iterable of decoded data chunks.
+def parseContentStreamChunks(chunks, operations, operands=None, pdf=None):
+    if operands is None:
+        operands = []
+    data = ""
+    for chunk in chunks:
+        if data:
+            data += chunk
+        else:
+            data = chunk
+        operands, pos = _parse(data, operations, operands, pdf, False)
+        data = data[pos:]
+    return _parse(data, operations, operands, pdf, True)[0]
+
+
+# Parses data as parseContentStream does.  Returns the operands left and the
+# position parsing stopped at.  Unless final is set, data is the beginning of
+# the content left to parse, and parsing stops before the first token which
+# reaches the end of the data, and might go on in the data following it.
+def _parse(data, operations, operands, pdf, final):
+    match = _tokenRe.match
+    size = len(data)
+    pos = 0
+    while True:
+        m = match(data, pos)
+        if m is None:
+            # end of data
+            return operands, size
+        if not final and m.end() >= size:
+            return operands, m.start()
+        kind = m.lastindex
+        if kind == 1:
+            operator = m.group(1)
+            if operator == "BI":
+                # begin inline image
+                assert operands == []
+                try:
+                    ii, end = _readInlineImage(data, m.end(), pdf, final)
+                except (PdfReadError, ValueError):
+                    if final:
+                        raise
+                    return operands, m.start()
+                if not final and end >= size:
+                    return operands, m.start()
+                operations.append((ii, "INLINE IMAGE"))
+                pos = end
+            else:
+                operations.append((operands, operator))
+                operands = []
+                pos = m.end()
+        elif kind == 2:
+            start = m.start(2)
+            if not final and start + 20 > size:
+                return operands, m.start()
+            ref = _indirectRe.match(data[start:start + 20])
+            if ref is not None:
+                operands.append(IndirectObject(int(ref.group(1)),
+                                               int(ref.group(2)), None))
+                pos = start + ref.end() - 1
+            else:
+                operands.append(_number(m.group(2)))
+                pos = m.end()
+        elif kind == 3:
+            operands.append(_number(m.group(3)))
+            pos = m.end()
+        elif kind == 4:
+            operands.append(NameObject(m.group(4).decode("utf-8")))
+            pos = m.end()
+        elif kind == 5:
+            pos = m.end()
+        else:
+            try:
+                obj, end = _readObject(data, m.start(6), None)
+            except (PdfReadError, ValueError):
+                # e.g. a string or an array, or a number in it, cut short
+                if final:
+                    raise
+                return operands, m.start()
+            if not final and end >= size:
+                return operands, m.start()
+            operands.append(obj)
+            pos = end
+
+
+def _number(token):
+    if "." in token:
+        return FloatObject(token)
+    else:
+        return NumberObject(token)
+
+
+# Reads the object starting at data[pos], like generic.readObject.  Returns
+# the object and the position following it.
+def _readObject(data, pos, pdf):
+    c = data[pos:pos + 1]
+    if c == "t" or c == "f":
+        word = data[pos:pos + 4]
+        if word == "true":
+            return BooleanObject(True), pos + 4
+        elif word == "fals":
+            return BooleanObject(False), pos + 5
+        raise PdfReadError("error reading boolean object at byte %s" %
+                           hexStr(pos))
+    elif c == "(":
+        return _readString(data, pos)
+    elif c == "/":
+        m = _nameRe.match(data, pos)
+        return NameObject(m.group().decode("utf-8")), m.end()
+    elif c == "[":
+        return _readArray(data, pos, pdf)
+    elif c == "n":
+        if data[pos:pos + 4] != "null":
+            raise PdfReadError("error reading null object")
+        return NullObject(), pos + 4
+    elif c == "<":
+        if data[pos:pos + 2] == "<<":
+            return _readDictionary(data, pos, pdf)
+        return _readHexString(data, pos)
+    elif c == "%":
+        pos = _commentRe.match(data, pos).end()
+        pos = _nonWhitespaceRe.match(data, pos).end()
+        return _readObject(data, pos, pdf)
+    elif c == "":
+        raise PdfStreamError("Stream has ended unexpectedly")
+    else:
+        if c != "+" and c != "-":
+            ref = _indirectRe.match(data[pos:pos + 20])
+            if ref is not None:
+                return (IndirectObject(int(ref.group(1)), int(ref.group(2)),
+                                       pdf), pos + ref.end() - 1)
+        m = _numberRe.match(data, pos)
+        return _number(m.group()), m.end()
+
+
+def _readString(data, pos):
+    parens = 1
+    pieces = []
+    pos += 1
+    while True:
+        m = _stringSpecialRe.search(data, pos)
+        if m is None:
+            raise PdfStreamError("Stream has ended unexpectedly")
+        start = m.start()
+        pieces.append(data[pos:start])
+        c = data[start]
+        pos = start + 1
+        if c == "(":
+            parens += 1
+            pieces.append(c)
+        elif c == ")":
+            parens -= 1
+            if parens == 0:
+                break
+            pieces.append(c)
+        else:
+            esc = data[pos:pos + 1]
+            if esc in _escapes:
+                pieces.append(_escapes[esc])
+                pos += 1
+            elif esc.isdigit():
+                # "The number ddd may consist of one, two, or three octal
+                # digits" (PDF reference 7.3.4.2); the generic reader drops
+                # the character following a shorter escape
+                m = _octalRe.match(data, pos)
+                pieces.append(chr(int(m.group(), 8)))
+                pos = m.end()
+            elif esc == "\n" or esc == "\r":
+                # escaped line break, possibly a two-character one
+                pos += 1
+                if data[pos:pos + 1] in ("\n", "\r"):
+                    pos += 1
+            elif esc == "":
+                raise PdfStreamError("Stream has ended unexpectedly")
+            else:
+                raise PdfReadError("Unexpected escaped string")
+    return createStringObject("".join(pieces)), pos
+
+
+def _readHexString(data, pos):
+    end = data.find(">", pos + 1)
+    if end == -1:
+        raise PdfStreamError("Stream has ended unexpectedly")
+    digits = data[pos + 1:end].translate(None, " \t\n\r")
+    if len(digits) % 2 == 1:
+        digits += "0"
+    if _hexDigitsRe.match(digits):
+        txt = binascii.unhexlify(digits)
+    else:
+        # let int() have its say on odd characters, like the generic reader
+        txt = "".join([chr(int(digits[i:i + 2], base=16))
+                       for i in xrange(0, len(digits), 2)])
+    return createStringObject(txt), end + 1
+
+
+def _readArray(data, pos, pdf):
+    arr = ArrayObject()
+    pos += 1
+    while True:
+        pos = _spaceRe.match(data, pos).end()
+        c = data[pos:pos + 1]
+        if c == "]":
+            return arr, pos + 1
+        obj, pos = _readObject(data, pos, pdf)
+        arr.append(obj)
+
+
+def _readDictionary(data, pos, pdf):
+    entries = {}
+    pos += 2
+    while True:
+        pos = _nonWhitespaceRe.match(data, pos).end()
+        c = data[pos:pos + 1]
+        if not c:
+            raise PdfStreamError("Stream has ended unexpectedly")
+        if c == ">":
+            pos += 2
+            break
+        key, pos = _readObject(data, pos, pdf)
+        pos = _nonWhitespaceRe.match(data, pos).end()
+        value, pos = _readObject(data, pos, pdf)
+        if key in entries:
+            # multiple definitions of key not permitted
+            raise PdfReadError("Multiple definitions in dictionary at byte "
+                               "%s for key %s" % (hexStr(pos), key))
+        entries[key] = value
+    retval = DictionaryObject()
+    retval.update(entries)
+    return retval, pos
+
+
+# Number of color components of the color spaces an inline image may use
+# directly, by full and abbreviated name.
+_inlineImageComponents = {
+    "/DeviceGray": 1, "/G": 1,
+    "/DeviceRGB": 3, "/RGB": 3,
+    "/DeviceCMYK": 4, "/CMYK": 4,
+    "/Indexed": 1, "/I": 1,
+}
+
+# EI operator ending the data of an inline image, delimited by whitespace.
+_endImageRe = re.compile(r"(?<=[ \t\n\r\x0c\x00])EI"
+                         r"(?=[ \t\n\r\x0c\x00/\[<(%]|$)")
+_endImageCheckRe = re.compile(r"[ \t\n\r\x0c\x00]*EI"
+                              r"(?=[ \t\n\r\x0c\x00/\[<(%]|$)")
+
+
+def _inlineImageSetting(settings, name, abbreviation):
+    value = settings.get(abbreviation)
+    if value is None:
+        value = settings.get(name)
+    return value
+
+
+# Returns the length of the data of an inline image, from its /L entry or from
+# the size of its samples when it is not encoded, or None if it is unknown.
+def _inlineImageLength(settings):
+    length = _inlineImageSetting(settings, "/Length", "/L")
+    if length is not None:
+        return int(length)
+    if _inlineImageSetting(settings, "/Filter", "/F") is not None:
+        return None
+    width = _inlineImageSetting(settings, "/Width", "/W")
+    height = _inlineImageSetting(settings, "/Height", "/H")
+    if width is None or height is None:
+        return None
+    if _inlineImageSetting(settings, "/ImageMask", "/IM"):
+        components, bpc = 1, 1
+    else:
+        bpc = _inlineImageSetting(settings, "/BitsPerComponent", "/BPC")
+        cs = _inlineImageSetting(settings, "/ColorSpace", "/CS")
+        if isinstance(cs, ArrayObject) and len(cs) > 0:
+            cs = cs[0]
+        components = _inlineImageComponents.get(cs)
+        if bpc is None or components is None:
+            # e.g. a named color space from the page resources
+            return None
+    return int(height) * ((int(width) * components * int(bpc) + 7) // 8)
+
+
+# Finds the EI operator ending the data of an inline image which starts at
+# data[pos].  The length of the data is used when it is known, so that "EI"
+# bytes within binary data are skipped; otherwise the first EI delimited by
+# whitespace is taken, falling back to the first "EI" of the data.
+#
+# Unless final is set, the data may go on after its end, and -1 is returned
+# when the EI operator taken in the whole data might be further on.
+def _findEndImage(data, pos, length, final=True):
+    if length is not None:
+        m = _endImageCheckRe.match(data, pos + length)
+        if m is not None:
+            return m.end() - 2
+        if not final and pos + length >= len(data):
+            return -1
+    m = _endImageRe.search(data, pos)
+    if m is not None:
+        return m.start()
+    if not final:
+        return -1
+    return data.find("EI", pos)
+
+
+# Reads an inline image, starting just after the BI operator: its dictionary,
+# the ID operator and the image data up to the EI operator.  final is passed
+# to _findEndImage.
+def _readInlineImage(data, pos, pdf, final=True):
+    settings = DictionaryObject()
+    while True:
+        pos = _nonWhitespaceRe.match(data, pos).end()
+        if data[pos:pos + 1] == "I":
+            # "ID" - begin of image data
+            break
+        key, pos = _readObject(data, pos, pdf)
+        pos = _nonWhitespaceRe.match(data, pos).end()
+        value, pos = _readObject(data, pos, pdf)
+        settings[key] = value
+    if data[pos:pos + 2] != "ID":
+        raise PdfReadError("error reading inline image at byte %s" %
+                           hexStr(pos))
+    # skip ID and the single whitespace character following it
+    pos += 3
+    end = _findEndImage(data, pos, _inlineImageLength(settings), final)
+    if end == -1:
+        raise PdfStreamError("Stream has ended unexpectedly")
+    # the image data keeps the whitespace preceding EI, which separates them
+    # when the content stream is written back
+    imageData = data[pos:end]
+    pos = _nonWhitespaceRe.match(data, end + 2).end()
+    return {"settings": settings, "data": imageData}, pos
+
+
+# Tokens that matter to renameOperandNames.  Numbers and whitespace are
+# skipped over by the search.
+_renameTokenRe = re.compile(
+    r"(/" + _regular + r")|"            # 1: name
+    r"(\()|"                            # 2: string
+    r"(<<|\[)|"                         # 3: start of dictionary or array
+    r"(>>|\])|"                         # 4: end of dictionary or array
+    r"(<)|"                             # 5: hex string
+    r"(%[^\r\n]*)|"                     # 6: comment
+    r"([A-Za-z'\"]" + _regular + r")")  # 7: operator
+
+
+def _stringEnd(data, pos):
+    # Returns the position following the string starting at data[pos].
+    parens = 0
+    while True:
+        m = _stringSpecialRe.search(data, pos)
+        if m is None:
+            raise PdfStreamError("Stream has ended unexpectedly")
+        c = m.group()
+        pos = m.end()
+        if c == "(":
+            parens += 1
+        elif c == ")":
+            parens -= 1
+            if parens == 0:
+                return pos
+        else:
+            # skip the escaped character
+            pos += 1
+
+
+##
+# Renames the names used as operands in the data of a content stream, e.g.
+# resource names, without parsing it into operations: only the renamed name
+# tokens are rewritten, the rest of the data is copied as is.  Like renaming
+# the operands of the parsed operations, names within arrays, dictionaries
+# and inline images are left alone.
+#
+# @param data The decoded content stream data.
+# @param rename A dictionary mapping old names to new names, e.g.
+#               {"/F1": "/F1renamed"}.
+# @return The new data, or the data itself if no name was renamed.
+def renameOperandNames(data, rename):
+    pieces = []
+    last = 0
+    depth = 0
+    pos = 0
+    search = _renameTokenRe.search
+    while True:
+        m = search(data, pos)
+        if m is None:
+            break
+        kind = m.lastindex
+        pos = m.end()
+        if kind == 1:
+            if depth == 0:
+                newName = rename.get(m.group(1))
+                if newName is not None:
+                    pieces.append(data[last:m.start()])
+                    pieces.append(newName)
+                    last = pos
+        elif kind == 2:
+            pos = _stringEnd(data, m.start())
+        elif kind == 3:
+            depth += 1
+        elif kind == 4:
+            depth -= 1
+        elif kind == 5:
+            pos = data.find(">", pos)
+            if pos == -1:
+                raise PdfStreamError("Stream has ended unexpectedly")
+            pos += 1
+        elif kind == 7 and m.group(7) == "BI":
+            ii, pos = _readInlineImage(data, pos, None)
+    if not pieces:
+        return data
+    pieces.append(data[last:])
+    return "".join(pieces)
+
+
+##
+# Iterates over the operators of the data of a content stream without
+# reading their operands, for a quick look at what the content stream draws.
+# Strings, arrays and dictionaries are skipped over, and inline images are
+# returned as their BI operator.
+#
+# @param data The decoded content stream data.
+# @return An iterator of (operator, name) pairs, where name is the last name
+#         operand of the operator, e.g. the XObject drawn by Do, or None.
+def iterOperators(data):
+    name = None
+    depth = 0
+    pos = 0
+    search = _renameTokenRe.search
+    while True:
+        m = search(data, pos)
+        if m is None:
+            return
+        kind = m.lastindex
+        pos = m.end()
+        if kind == 7:
+            operator = m.group(7)
+            if depth or operator in ("true", "false", "null"):
+                continue
+            if operator == "BI":
+                ii, pos = _readInlineImage(data, pos, None)
+            yield operator, name
+            name = None
+        elif kind == 1:
+            if depth == 0:
+                name = m.group(1)
+        elif kind == 2:
+            pos = _stringEnd(data, m.start())
+        elif kind == 3:
+            depth += 1
+        elif kind == 4:
+            depth -= 1
+        elif kind == 5:
+            pos = data.find(">", pos)
+            if pos == -1:
+                raise PdfStreamError("Stream has ended unexpectedly")
+            pos += 1
+
+
+if __name__ == "__main__":
+    def inlineImage(data):
+        operations = []
+        parseContentStream(data, operations)
+        assert operations[-1] == ([], "Q")
+        return operations[0][0]["data"]
+
+    # the length of the data is taken from /L, or from the size of the
+    # samples, so that "EI" within the data is skipped
+    assert inlineImage("BI /L 6 /F /AHx ID a EI b EI Q") == "a EI b "
+    assert inlineImage("BI /W 2 /H 2 /CS /G /BPC 8 ID EI\x00E EI Q") == \
+        "EI\x00E "
+    # otherwise the data ends at the first EI delimited by whitespace
+    assert inlineImage("BI /W 2 /H 1 /F /AHx ID 4142> EI Q") == "4142> "
+
+    # tokens cut by the end of a chunk are parsed with the next chunk
+    operations = []
+    operands = parseContentStreamChunks(
+        ["0 0 1", "0 10 re (a", "b) Tj BI /L 2 ", "ID xy", " EI 1 2"],
+        operations)
+    assert operands == [1, 2]
+    assert operations[:2] == [([0, 0, 10, 10], "re"), ([u"ab"], "Tj")]
+    assert operations[2][0]["data"] == "xy "
@@ -36,167 +36,600 @@ Implementation of stream filters for PDF.
 __author__ = "Mathieu Fenniak"
 __author_email__ = "biziqe@mathieu.fenniak.net"
 
-from utils import PdfReadError
-from StringIO import StringIO
+from utils import PdfReadError, PdfStreamError, PdfDecodeLimitError
+from utils import PdfReadWarning, b_
 
+import binascii
+import struct
+import threading
+import warnings
 import zlib
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
+# Maximum size of the chunks produced by the streaming decoders.
+CHUNK_SIZE = 64 * 1024
 
-def decompress(data):
-    return zlib.decompress(data)
 
+##
+# Output limits enforced while decoding stream data.  A single instance is
+# normally shared by all the streams of a document, so that the document limit
+# bounds the total amount of data decoded from that document.
+#
+# @param maxStreamLength Maximum number of bytes a single stream may decode
+#                        to, or None for no limit.
+# @param maxDocumentLength Maximum number of bytes all the streams sharing
+#                          these limits may decode to, or None for no limit.
+class DecodeLimits(object):
+    def __init__(self, maxStreamLength=None, maxDocumentLength=None):
+        self.maxStreamLength = maxStreamLength
+        self.maxDocumentLength = maxDocumentLength
+        self.documentLength = 0
+        self._lock = threading.Lock()
 
-def compress(data):
-    return zlib.compress(data)
+    # Limits are copied to worker processes without their lock.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
 
-class FlateDecode(object):
-    def decode(data, decodeParms):
-        data = decompress(data)
-        predictor = 1
-        if decodeParms:
-            predictor = decodeParms.get("/Predictor", 1)
-        # predictor 1 == no predictor
-        if predictor != 1:
-            columns = decodeParms["/Columns"]
-            # PNG prediction:
-            if predictor >= 10 and predictor <= 15:
-                output = StringIO()
-                # PNG prediction can vary from row to row
-                rowlength = columns + 1
-                assert len(data) % rowlength == 0
-                prev_rowdata = (0,) * rowlength
-                for row in xrange(len(data) / rowlength):
-                    rowdata = [ord(x) for x
-                               in data[(row*rowlength):((row+1)*rowlength)]]
-                    filterByte = rowdata[0]
-                    if filterByte == 0:
-                        pass
-                    elif filterByte == 1:
-                        for i in range(2, rowlength):
-                            rowdata[i] = (rowdata[i] + rowdata[i-1]) % 256
-                    elif filterByte == 2:
-                        for i in range(1, rowlength):
-                            rowdata[i] = (rowdata[i] + prev_rowdata[i]) % 256
+    ##
+    # Records that size more bytes have been decoded, streamLength being the
+    # total decoded so far for the current stream.
+    # @exception PdfDecodeLimitError One of the limits has been exceeded.
+    def account(self, streamLength, size):
+        if self.maxStreamLength is not None and \
+                streamLength > self.maxStreamLength:
+            raise PdfDecodeLimitError("Decoded stream exceeds the limit of "
+                                      "%d bytes" % self.maxStreamLength)
+        self._lock.acquire()
+        try:
+            self.documentLength += size
+            documentLength = self.documentLength
+        finally:
+            self._lock.release()
+        if self.maxDocumentLength is not None and \
+                documentLength > self.maxDocumentLength:
+            raise PdfDecodeLimitError("Decoded streams exceed the document "
+                                      "limit of %d bytes" %
+                                      self.maxDocumentLength)
+
+
+##
+# Inflates data incrementally, yielding decoded chunks of at most chunkSize
+# bytes, so that the whole decoded stream never has to be held in memory.
+#
+# @param limits A {@link #DecodeLimits DecodeLimits} instance, or None.
+# @param strict When false, a truncated or corrupted stream produces a
+#               warning and the data decoded up to the error, instead of an
+#               exception.
+def decompressChunks(data, limits=None, strict=True, chunkSize=CHUNK_SIZE):
+    d = zlib.decompressobj()
+    length = 0
+    try:
+        chunk = d.decompress(data, chunkSize)
+        while chunk:
+            length += len(chunk)
+            if limits is not None:
+                limits.account(length, len(chunk))
+            yield chunk
+            chunk = d.decompress(d.unconsumed_tail, chunkSize)
+        complete = _endOfStream(d)
+        chunk = d.flush()
+    except zlib.error, e:
+        if strict:
+            raise
+        warnings.warn("Corrupted FlateDecode stream, using the %d bytes "
+                      "decoded before the error (%s)" % (length, e),
+                      PdfReadWarning)
+        return
+    if chunk:
+        length += len(chunk)
+        if limits is not None:
+            limits.account(length, len(chunk))
+        yield chunk
+    if not complete:
+        if strict:
+            raise PdfStreamError("FlateDecode stream is truncated")
+        warnings.warn("Truncated FlateDecode stream, using the %d bytes "
+                      "decoded" % length, PdfReadWarning)
+
+
+def _endOfStream(d):
+    # Decompression objects only report the end of the stream on Python 3.3+.
+    # Otherwise, feed a copy of the object one more byte: it is handed back
+    # as unused data if and only if the stream is complete.
+    if hasattr(d, "eof"):
+        return d.eof
+    if d.unused_data:
+        return True
+    probe = d.copy()
+    try:
+        probe.decompress(b_("\x00"))
+    except zlib.error:
+        return False
+    return bool(probe.unused_data)
+
+
+def decompress(data, limits=None, strict=True):
+    return b_("").join(decompressChunks(data, limits, strict))
+
+
+##
+# Compresses data in the zlib format.
+# @param level Compression level, from 0 (none) through 1 (fastest) to 9
+#              (smallest output).
+# @param strategy One of the zlib strategies, such as zlib.Z_FILTERED.
+def compress(data, level=zlib.Z_DEFAULT_COMPRESSION,
+             strategy=zlib.Z_DEFAULT_STRATEGY):
+    if strategy == zlib.Z_DEFAULT_STRATEGY:
+        return zlib.compress(data, level)
+    c = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS,
+                         zlib.DEF_MEM_LEVEL, strategy)
+    return c.compress(data) + c.flush()
+
+
+def _applyPredictor(data, decodeParms):
+    # Undoes the TIFF or PNG prediction described by decodeParms, shared by
+    # the FlateDecode and LZWDecode filters.
+    predictor = 1
+    if decodeParms:
+        predictor = decodeParms.get("/Predictor", 1)
+    # predictor 1 == no predictor
+    if predictor == 1:
+        return data
+    colors = decodeParms.get("/Colors", 1)
+    bitsPerComponent = decodeParms.get("/BitsPerComponent", 8)
+    columns = decodeParms.get("/Columns", 1)
+    # bytes per complete pixel, and per row of pixels
+    bpp = max(1, colors * bitsPerComponent // 8)
+    rowlength = (colors * bitsPerComponent * columns + 7) // 8
+    data = bytearray(data)
+    if predictor == 2:
+        # TIFF prediction
+        if bitsPerComponent != 8:
+            raise PdfReadError("Unsupported TIFF predictor with %r bits per "
+                               "component" % bitsPerComponent)
+        for start in xrange(0, len(data), rowlength):
+            for i in xrange(start + bpp, min(start + rowlength, len(data))):
+                data[i] = (data[i] + data[i - bpp]) & 0xff
+        return bytes(data)
+    elif predictor >= 10 and predictor <= 15:
+        # PNG prediction can vary from row to row
+        output = bytearray()
+        prev_rowdata = bytearray(rowlength)
+        for start in xrange(0, len(data), rowlength + 1):
+            filterByte = data[start]
+            rowdata = data[start + 1:start + rowlength + 1]
+            if filterByte == 0:
+                pass
+            elif filterByte == 1:
+                # Sub
+                for i in xrange(bpp, len(rowdata)):
+                    rowdata[i] = (rowdata[i] + rowdata[i - bpp]) & 0xff
+            elif filterByte == 2:
+                # Up
+                for i in xrange(len(rowdata)):
+                    rowdata[i] = (rowdata[i] + prev_rowdata[i]) & 0xff
+            elif filterByte == 3:
+                # Average
+                for i in xrange(min(bpp, len(rowdata))):
+                    rowdata[i] = (rowdata[i] + (prev_rowdata[i] >> 1)) & 0xff
+                for i in xrange(bpp, len(rowdata)):
+                    rowdata[i] = (rowdata[i] + ((rowdata[i - bpp] +
+                                                 prev_rowdata[i]) >> 1)) & 0xff
+            elif filterByte == 4:
+                # Paeth
+                for i in xrange(len(rowdata)):
+                    up = prev_rowdata[i]
+                    if i >= bpp:
+                        left = rowdata[i - bpp]
+                        upLeft = prev_rowdata[i - bpp]
                     else:
-                        # unsupported PNG filter
-                        raise PdfReadError("Unsupported PNG filter %r" %
-                                           filterByte)
-                    prev_rowdata = rowdata
-                    output.write(''.join([chr(x) for x in rowdata[1:]]))
-                data = output.getvalue()
+                        left = upLeft = 0
+                    p = left + up - upLeft
+                    pLeft, pUp, pUpLeft = abs(p - left), abs(p - up), \
+                        abs(p - upLeft)
+                    if pLeft <= pUp and pLeft <= pUpLeft:
+                        pred = left
+                    elif pUp <= pUpLeft:
+                        pred = up
+                    else:
+                        pred = upLeft
+                    rowdata[i] = (rowdata[i] + pred) & 0xff
             else:
-                # unsupported predictor
-                raise PdfReadError("Unsupported flatedecode predictor %r" %
-                                   predictor)
-        return data
+                # unsupported PNG filter
+                raise PdfReadError("Unsupported PNG filter %r" % filterByte)
+            prev_rowdata = rowdata
+            output += rowdata
+        return bytes(output)
+    else:
+        # unsupported predictor
+        raise PdfReadError("Unsupported predictor %r" % predictor)
+
+
+class FlateDecode(object):
+    def decode(data, decodeParms, limits=None, strict=True):
+        return _applyPredictor(decompress(data, limits, strict), decodeParms)
     decode = staticmethod(decode)
 
-    def encode(data):
-        return compress(data)
+    ##
+    # Same as decode, but yields the decoded data in chunks.  Data using a
+    # predictor is yielded in a single chunk.
+    def decodeChunks(data, decodeParms, limits=None, strict=True):
+        if decodeParms and decodeParms.get("/Predictor", 1) != 1:
+            yield FlateDecode.decode(data, decodeParms, limits, strict)
+            return
+        for chunk in decompressChunks(data, limits, strict):
+            yield chunk
+    decodeChunks = staticmethod(decodeChunks)
+
+    def encode(data, level=zlib.Z_DEFAULT_COMPRESSION,
+               strategy=zlib.Z_DEFAULT_STRATEGY):
+        return compress(data, level, strategy)
     encode = staticmethod(encode)
 
 
+# Whitespace characters, as defined in section 3.1.1 of the PDF reference.
+_whitespace = b_(" \t\n\r\x0c\x00")
+
+# Maximum length of the lines produced by the ASCII encoders.
+_asciiLineLength = 76
+
+
+def _wrapLines(data, width=_asciiLineLength):
+    return b_("\n").join([data[i:i + width]
+                          for i in xrange(0, len(data), width)])
+
+
 class ASCIIHexDecode(object):
-    def decode(data, decodeParms=None):
-        retval = ""
-        char = ""
-        x = 0
-        while True:
-            c = data[x]
-            if c == ">":
-                break
-            elif c.isspace():
-                x += 1
-                continue
-            char += c
-            if len(char) == 2:
-                retval += chr(int(char, base=16))
-                char = ""
-            x += 1
-        assert char == ""
-        return retval
+    def decode(data, decodeParms=None, limits=None, strict=True):
+        eod = data.find(b_(">"))
+        if eod != -1:
+            data = data[:eod]
+        data = data.translate(None, _whitespace)
+        if len(data) % 2:
+            # a missing final digit is assumed to be 0
+            data += b_("0")
+        try:
+            return binascii.unhexlify(data)
+        except (TypeError, binascii.Error):
+            raise PdfReadError("Invalid character in ASCIIHexDecode stream")
     decode = staticmethod(decode)
 
+    def encode(data):
+        return _wrapLines(binascii.hexlify(data)) + b_(">")
+    encode = staticmethod(encode)
+
 
 class ASCII85Decode(object):
-    def decode(data, decodeParms=None):
-        retval = ""
-        group = []
-        x = 0
-        hitEod = False
-        # remove all whitespace from data
-        data = [y for y in data if not (y in ' \n\r\t')]
-        while not hitEod:
-            c = data[x]
-            if len(retval) == 0 and c == "<" and data[x+1] == "~":
-                x += 2
+    # value of a group of 5 "!" characters, subtracted from every group
+    _offset = 33 * (85 ** 4 + 85 ** 3 + 85 ** 2 + 85 + 1)
+
+    def decode(data, decodeParms=None, limits=None, strict=True):
+        data = data.translate(None, _whitespace)
+        if data.startswith(b_("<~")):
+            data = data[2:]
+        eod = data.find(b_("~>"))
+        if eod != -1:
+            data = data[:eod]
+        if b_("z") in data:
+            # "z" stands for a whole group of zeros, between groups only
+            pieces = data.split(b_("z"))
+            for piece in pieces[:-1]:
+                if len(piece) % 5:
+                    raise PdfReadError("Invalid z in ASCII85Decode stream")
+            data = b_("!!!!!").join(pieces)
+        tail = len(data) % 5
+        if tail == 1:
+            # cannot have a final group of just 1 char
+            raise PdfReadError("Invalid final group in ASCII85Decode stream")
+        elif tail:
+            data += b_("u") * (5 - tail)
+        chars = bytearray(data)
+        if chars and (min(chars) < 33 or max(chars) > 117):
+            raise PdfReadError("Invalid character in ASCII85Decode stream")
+        retval = bytearray(len(chars) // 5 * 4)
+        pack = struct.Struct(">L").pack_into
+        offset = ASCII85Decode._offset
+        j = 0
+        try:
+            for i in xrange(0, len(chars), 5):
+                pack(retval, j, chars[i] * 52200625 + chars[i + 1] * 614125 +
+                     chars[i + 2] * 7225 + chars[i + 3] * 85 + chars[i + 4] -
+                     offset)
+                j += 4
+        except struct.error:
+            raise PdfReadError("Invalid group in ASCII85Decode stream")
+        if tail:
+            del retval[tail - 5:]
+        return bytes(retval)
+    decode = staticmethod(decode)
+
+    def encode(data):
+        tail = len(data) % 4
+        if tail:
+            data += b_("\x00") * (4 - tail)
+        digits = _ascii85Digits
+        groups = []
+        for word in struct.unpack(">%dL" % (len(data) // 4), data):
+            if word == 0:
+                groups.append(b_("z"))
                 continue
-            #elif c.isspace():
-            #    x += 1
-            #    continue
-            elif c == 'z':
-                assert len(group) == 0
-                retval += '\x00\x00\x00\x00'
+            word, c5 = divmod(word, 85)
+            word, c4 = divmod(word, 85)
+            word, c3 = divmod(word, 85)
+            c1, c2 = divmod(word, 85)
+            groups.append(digits[c1] + digits[c2] + digits[c3] +
+                          digits[c4] + digits[c5])
+        if tail:
+            # the final partial group is never abbreviated to "z"
+            if groups[-1] == b_("z"):
+                groups[-1] = b_("!!!!!")
+            groups[-1] = groups[-1][:tail + 1]
+        return _wrapLines(b_("").join(groups)) + b_("~>")
+    encode = staticmethod(encode)
+
+_ascii85Digits = [b_(chr(33 + i)) for i in xrange(85)]
+
+
+class LZWDecode(object):
+    def decode(data, decodeParms=None, limits=None, strict=True):
+        earlyChange = 1
+        if decodeParms:
+            earlyChange = decodeParms.get("/EarlyChange", 1)
+        output = []
+        length = accounted = 0
+        table = [b_(chr(i)) for i in xrange(256)] + [None, None]
+        width = 9
+        previous = None
+        bits = nbits = 0
+        for byte in bytearray(data):
+            bits = (bits << 8) | byte
+            nbits += 8
+            if nbits < width:
+                continue
+            nbits -= width
+            code = bits >> nbits
+            bits &= (1 << nbits) - 1
+            if code == 256:
+                # clear-table
+                del table[258:]
+                width = 9
+                previous = None
                 continue
-            elif c == "~" and data[x+1] == ">":
-                if len(group) != 0:
-                    # cannot have a final group of just 1 char
-                    assert len(group) > 1
-                    cnt = len(group) - 1
-                    group += [85, 85, 85]
-                    hitEod = cnt
-                else:
-                    break
+            elif code == 257:
+                # end of data
+                break
+            elif code < len(table):
+                entry = table[code]
+                if previous is not None and len(table) < 4096:
+                    table.append(previous + entry[:1])
+            elif code == len(table) and previous is not None:
+                entry = previous + previous[:1]
+                table.append(entry)
+            else:
+                if strict:
+                    raise PdfReadError("Invalid LZWDecode code %d" % code)
+                warnings.warn("Invalid LZWDecode code %d, using the %d bytes "
+                              "decoded" % (code, length), PdfReadWarning)
+                break
+            output.append(entry)
+            previous = entry
+            length += len(entry)
+            if limits is not None and length - accounted >= CHUNK_SIZE:
+                limits.account(length, length - accounted)
+                accounted = length
+            if len(table) + earlyChange >= (1 << width) and width < 12:
+                width += 1
+        if limits is not None and length > accounted:
+            limits.account(length, length - accounted)
+        return _applyPredictor(b_("").join(output), decodeParms)
+    decode = staticmethod(decode)
+
+
+class RunLengthDecode(object):
+    def decode(data, decodeParms=None, limits=None, strict=True):
+        data = bytearray(data)
+        output = bytearray()
+        accounted = 0
+        i = 0
+        while i < len(data):
+            runLength = data[i]
+            if runLength < 128:
+                # copy the next runLength + 1 bytes literally
+                output += data[i + 1:i + runLength + 2]
+                i += runLength + 2
+            elif runLength > 128:
+                # repeat the next byte 257 - runLength times
+                output += data[i + 1:i + 2] * (257 - runLength)
+                i += 2
             else:
-                c = ord(c) - 33
-                assert c >= 0 and c < 85
-                group += [c]
-            if len(group) >= 5:
-                b = group[0] * (85**4) + \
-                    group[1] * (85**3) + \
-                    group[2] * (85**2) + \
-                    group[3] * 85 + \
-                    group[4]
-                assert b < (2**32 - 1)
-                c4 = chr((b >> 0) % 256)
-                c3 = chr((b >> 8) % 256)
-                c2 = chr((b >> 16) % 256)
-                c1 = chr(b >> 24)
-                retval += (c1 + c2 + c3 + c4)
-                if hitEod:
-                    retval = retval[:-4+hitEod]
-                group = []
-            x += 1
-        return retval
+                # end of data
+                break
+            if limits is not None and len(output) - accounted >= CHUNK_SIZE:
+                limits.account(len(output), len(output) - accounted)
+                accounted = len(output)
+        if limits is not None and len(output) > accounted:
+            limits.account(len(output), len(output) - accounted)
+        return bytes(output)
+    decode = staticmethod(decode)
+
+
+class Crypt(object):
+    def decode(data, decodeParms=None, limits=None, strict=True):
+        # Only the identity crypt filter is supported: the data has already
+        # been decrypted with the document's default security handler.
+        if decodeParms and decodeParms.get("/Name", "/Identity") != \
+                "/Identity":
+            raise NotImplementedError("/Crypt filter with /Name or"
+                                      " /Type not supported yet")
+        return data
     decode = staticmethod(decode)
 
 
-def decodeStreamData(stream):
-    from generic import NameObject
-    filters = stream.get("/Filter", ())
-    if len(filters) and not isinstance(filters[0], NameObject):
+# Stream filter implementations, by filter name.
+_filters = {}
+
+
+##
+# Registers the implementation of a stream filter.  The implementation must
+# provide a decode(data, decodeParms, limits, strict) function, and may
+# provide an encode(data, **params) function, and a decodeChunks function
+# taking the same arguments as decode and yielding the decoded data in chunks.
+#
+# @param name The name of the filter, e.g. "/FlateDecode".
+# @param implementation The filter class (or any object with these
+#                       functions).
+# @param aliases Other names of the filter, such as the abbreviations used in
+#                inline images.
+def registerFilter(name, implementation, *aliases):
+    for filterName in (name,) + aliases:
+        _filters[filterName] = implementation
+
+
+##
+# Returns the implementation registered for a filter name.
+# @exception NotImplementedError No implementation is registered.
+def getFilter(name):
+    try:
+        return _filters[name]
+    except KeyError:
+        # unsupported filter
+        raise NotImplementedError("unsupported filter %s" % name)
+
+registerFilter("/FlateDecode", FlateDecode, "/Fl")
+registerFilter("/LZWDecode", LZWDecode, "/LZW")
+registerFilter("/RunLengthDecode", RunLengthDecode, "/RL")
+registerFilter("/ASCIIHexDecode", ASCIIHexDecode, "/AHx")
+registerFilter("/ASCII85Decode", ASCII85Decode, "/A85")
+registerFilter("/Crypt", Crypt)
+
+
+##
+# Returns the filter chain of a stream, as a list of (filter name, decode
+# parameters) pairs in decoding order.  Parameters are None when absent.
+def getFilterChain(stream):
+    from generic import ArrayObject
+    filters = stream.get("/Filter")
+    parms = stream.get("/DecodeParms")
+    if filters is None:
+        return []
+    if not isinstance(filters, ArrayObject):
         # we have a single filter instance
-        filters = (filters,)
+        filters = [filters]
+        parms = [parms]
+    elif not isinstance(parms, ArrayObject):
+        # /DecodeParms should be an array matching /Filter, but the odd PDF
+        # file uses a single dictionary
+        parms = [parms] * len(filters)
+    chain = []
+    for i in xrange(len(filters)):
+        p = None
+        if i < len(parms) and parms[i] is not None:
+            p = parms[i].getObject()
+            if not hasattr(p, "get"):
+                # null entry
+                p = None
+        chain.append((filters[i].getObject(), p))
+    return chain
+
+
+def decodeStreamData(stream, chain=None):
+    return b_("").join(decodeStreamChunks(stream, chain))
+
+
+##
+# Decodes the data of a stream object, yielding it in chunks.  The last filter
+# of the chain decodes incrementally when it can, e.g. FlateDecode; the other
+# filters work on the whole data.  The decode limits and strictness are taken
+# from the PDF file the stream was read from, if any.
+#
+# @param chain The filters to apply, as returned by {@link #getFilterChain
+#              getFilterChain}.  Defaults to the whole filter chain of the
+#              stream; a prefix of it decodes the data only partially.
+def decodeStreamChunks(stream, chain=None):
+    full = chain is None
+    if full:
+        chain = getFilterChain(stream)
+    pdf = getattr(stream, "pdf", None)
+    limits = getattr(pdf, "decodeLimits", None)
+    strict = getattr(pdf, "strict", True)
+    if limits is not None and getattr(stream, "_decodeCounted", False):
+        # decoded before, e.g. evicted from the decoded stream cache: the
+        # stream counts once towards the document limit
+        limits = DecodeLimits(limits.maxStreamLength)
     data = stream._data
-    for filterType in filters:
-        if filterType == "/FlateDecode":
-            data = FlateDecode.decode(data, stream.get("/DecodeParms"))
-        elif filterType == "/ASCIIHexDecode":
-            data = ASCIIHexDecode.decode(data)
-        elif filterType == "/ASCII85Decode":
-            data = ASCII85Decode.decode(data)
-        elif filterType == "/Crypt":
-            decodeParams = stream.get("/DecodeParams", {})
-            if "/Name" not in decodeParams and "/Type" not in decodeParams:
-                pass
-            else:
-                raise NotImplementedError("/Crypt filter with /Name or"
-                                          " /Type not supported yet")
-        else:
-            # unsupported filter
-            raise NotImplementedError("unsupported filter %s" % filterType)
-    return data
+    for filterName, parms in chain[:-1]:
+        data = getFilter(filterName).decode(data, parms, limits, strict)
+    if chain:
+        filterName, parms = chain[-1]
+        implementation = getFilter(filterName)
+        if hasattr(implementation, "decodeChunks"):
+            for chunk in implementation.decodeChunks(data, parms, limits,
+                                                     strict):
+                yield chunk
+            if full:
+                stream._decodeCounted = True
+            return
+        data = implementation.decode(data, parms, limits, strict)
+    if full:
+        stream._decodeCounted = True
+    yield data
+
+
+##
+# Decodes a batch of streams in a pool of threads, so that the decoded data of
+# each stream is ready in the decoded stream cache of its PDF file.  zlib
+# releases the interpreter lock while inflating, so Flate encoded streams are
+# decoded in parallel.  Everything that needs to read from the PDF file, such
+# as resolving indirect /Filter and /DecodeParms entries, is done beforehand
+# in the calling thread.
+#
+# @param streams A list of stream objects.
+# @param workers Number of threads, defaults to the number of CPUs.
+# @return The total size of the decoded data.
+# @exception PdfReadError The first error raised by a stream, if any.
+def decodeStreams(streams, workers=None):
+    pending = []
+    seen = set()
+    for stream in streams:
+        if id(stream) in seen or not hasattr(stream, "iterData"):
+            continue
+        seen.add(id(stream))
+        getFilterChain(stream)
+        pending.append(stream)
+    if workers is None:
+        workers = cpu_count()
+    if workers <= 1 or len(pending) <= 1:
+        return sum([len(stream.getData()) for stream in pending])
+    pool = ThreadPool(min(workers, len(pending)))
+    try:
+        sizes = pool.map(_decodedLength, pending)
+    finally:
+        pool.close()
+        pool.join()
+    return sum(sizes)
+
+
+def _decodedLength(stream):
+    return len(stream.getData())
+
+
+##
+# Encodes data with a registered filter.
+# @param params Parameters for the encoder, e.g. level and strategy for
+#               FlateDecode.
+def encode(filterName, data, **params):
+    implementation = getFilter(filterName)
+    if not hasattr(implementation, "encode"):
+        raise NotImplementedError("no encoder for filter %s" % filterName)
+    return implementation.encode(data, **params)
+
 
 if __name__ == "__main__":
     assert "abc" == ASCIIHexDecode.decode('61\n626\n3>')
@@ -214,3 +647,43 @@ if __name__ == "__main__":
         "and indefatigable generation of knowledge, exceeds the short " \
         "vehemence of any carnal pleasure."
     assert ASCII85Decode.decode(ascii85Test) == ascii85_originalText
+
+    assert ASCII85Decode.decode("<~z9jqo^z~>") == "\x00" * 4 + "Man " + \
+        "\x00" * 4
+    try:
+        ASCII85Decode.decode("!!z!!!")
+        assert False
+    except PdfReadError:
+        pass
+    binaryTest = "".join([chr(i % 256) for i in xrange(1000)]) + "\x00" * 9
+    for i in xrange(len(binaryTest)):
+        assert ASCII85Decode.decode(ASCII85Decode.encode(binaryTest[i:])) == \
+            binaryTest[i:]
+    assert ASCIIHexDecode.decode(ASCIIHexDecode.encode(binaryTest)) == \
+        binaryTest
+    assert ASCIIHexDecode.decode("6 1626>") == "ab`"
+
+    assert LZWDecode.decode("\x80\x0b\x60\x50\x22\x0c\x0c\x85\x01") == \
+        "-----A---B"
+    assert RunLengthDecode.decode("\x02abc\xfdd\x00e\x80junk") == "abcdddde"
+
+    assert getFilter("/AHx") is ASCIIHexDecode
+    assert decompress(encode("/FlateDecode", "abc" * 100, level=9,
+                             strategy=zlib.Z_FILTERED)) == "abc" * 100
+
+    flateTest = compress(ascii85_originalText * 1000)
+    chunks = list(decompressChunks(flateTest, chunkSize=4096))
+    assert max([len(c) for c in chunks]) == 4096
+    assert "".join(chunks) == ascii85_originalText * 1000
+    try:
+        decompress(flateTest, DecodeLimits(maxStreamLength=10000))
+        assert False
+    except PdfDecodeLimitError:
+        pass
+    try:
+        decompress(flateTest[:-10])
+        assert False
+    except PdfStreamError:
+        pass
+    warnings.simplefilter("ignore", PdfReadWarning)
+    assert decompress(flateTest[:-10], strict=False)
@@ -601,7 +601,7 @@ class DictionaryObject(dict, PdfObject):
         else:
             stream.seek(pos, 0)
         if "__streamdata__" in data:
-            return StreamObject.initializeFromDictionary(data)
+            return StreamObject.initializeFromDictionary(data, pdf)
         else:
             retval = DictionaryObject()
             retval.update(data)
@@ -743,6 +743,8 @@ class StreamObject(DictionaryObject):
     def __init__(self):
         self._data = None
         self.decodedSelf = None
+        # PDF file the stream was read from, which provides the decode limits
+        self.pdf = None
 
     def writeToStream(self, stream, encryption_key):
         self[NameObject("/Length")] = NumberObject(len(self._data))
@@ -755,11 +757,12 @@ class StreamObject(DictionaryObject):
         stream.write(data)
         stream.write(b_("\nendstream"))
 
-    def initializeFromDictionary(data):
+    def initializeFromDictionary(data, pdf=None):
         if "/Filter" in data:
             retval = EncodedStreamObject()
         else:
             retval = DecodedStreamObject()
+        retval.pdf = pdf
         retval._data = data["__streamdata__"]
         del data["__streamdata__"]
         del data["/Length"]
@@ -767,21 +770,68 @@ class StreamObject(DictionaryObject):
         return retval
     initializeFromDictionary = staticmethod(initializeFromDictionary)
 
-    def flateEncode(self):
+    ##
+    # Returns a copy of this stream with a FlateDecode filter applied on top
+    # of its current filters.
+    # @param level zlib compression level, from 1 (fastest) to 9 (smallest
+    #              output).  Defaults to zlib's default level.
+    # @param strategy zlib compression strategy, e.g. zlib.Z_FILTERED.
+    def flateEncode(self, level=None, strategy=None):
+        params = {}
+        if level is not None:
+            params["level"] = level
+        if strategy is not None:
+            params["strategy"] = strategy
+        return self.encode("/FlateDecode", **params)
+
+    ##
+    # Returns a copy of this stream with an ASCII85Decode filter applied on
+    # top of its current filters, making its data 7-bit clean.
+    def ascii85Encode(self):
+        return self.encode("/ASCII85Decode")
+
+    ##
+    # Returns a copy of this stream with an ASCIIHexDecode filter applied on
+    # top of its current filters, making its data 7-bit clean.
+    def asciiHexEncode(self):
+        return self.encode("/ASCIIHexDecode")
+
+    ##
+    # Returns a copy of this stream with the given filter applied on top of
+    # its current filters.
+    # @param filterName Name of a filter registered in the {@link #filters
+    #                   filters} module which has an encoder.
+    # @param params Parameters passed to the encoder.
+    def encode(self, filterName, **params):
+        return self._encode(NameObject(filterName),
+                            filters.encode(filterName, self._data, **params))
+
+    def _encode(self, filterName, data):
+        # Builds the encoded stream: filterName becomes the first filter of
+        # the chain, and the other entries of the dictionary are kept.
+        retval = EncodedStreamObject()
+        for key, value in self.items():
+            if key not in ("/Length", "/Filter", "/DecodeParms"):
+                retval[key] = value
         if "/Filter" in self:
             f = self["/Filter"]
+            newf = ArrayObject([filterName])
             if isinstance(f, ArrayObject):
-                f.insert(0, NameObject("/FlateDecode"))
+                newf.extend(f)
             else:
-                newf = ArrayObject()
-                newf.append(NameObject("/FlateDecode"))
                 newf.append(f)
-                f = newf
+            retval[NameObject("/Filter")] = newf
+            if "/DecodeParms" in self:
+                parms = self["/DecodeParms"]
+                newparms = ArrayObject([NullObject()])
+                if isinstance(parms, ArrayObject):
+                    newparms.extend(parms)
+                else:
+                    newparms.append(parms)
+                retval[NameObject("/DecodeParms")] = newparms
         else:
-            f = NameObject("/FlateDecode")
-        retval = EncodedStreamObject()
-        retval[NameObject("/Filter")] = f
-        retval._data = filters.FlateDecode.encode(self._data)
+            retval[NameObject("/Filter")] = filterName
+        retval._data = data
         return retval
 
 
@@ -789,6 +839,9 @@ class DecodedStreamObject(StreamObject):
     def getData(self):
         return self._data
 
+    def iterData(self):
+        yield self._data
+
     def setData(self, data):
         self._data = data
 
@@ -796,8 +849,18 @@ class DecodedStreamObject(StreamObject):
 class EncodedStreamObject(StreamObject):
     def __init__(self):
         self.decodedSelf = None
+        self.pdf = None
 
     def getData(self):
+        cache = getattr(self.pdf, "decodedCache", None)
+        if cache is not None:
+            # streams of a reader share its memory-budgeted cache; evicted
+            # streams are simply decoded again
+            data = cache.get(self)
+            if data is None:
+                data = filters.decodeStreamData(self)
+                cache.put(self, data)
+            return data
         if self.decodedSelf:
             # cached version of decoded object
             return self.decodedSelf.getData()
@@ -811,6 +874,23 @@ class EncodedStreamObject(StreamObject):
             self.decodedSelf = decoded
             return decoded._data
 
+    ##
+    # Yields the decoded data in chunks, without keeping a decoded copy of the
+    # stream around.  Suitable for consumers which process the data
+    # sequentially, such as image extraction.
+    def iterData(self):
+        cache = getattr(self.pdf, "decodedCache", None)
+        if cache is not None:
+            data = cache.get(self)
+            if data is not None:
+                yield data
+                return
+        if self.decodedSelf:
+            yield self.decodedSelf.getData()
+        else:
+            for chunk in filters.decodeStreamChunks(self):
+                yield chunk
+
     def setData(self, data):
         raise utils.PdfReadError("Creating EncodedStreamObject is "
                                  "not currently supported")
@@ -1004,25 +1084,13 @@ class Bookmark(Destination):
 
 
 def encode_pdfdocencoding(unicode_string):
-    retval = b_('')
-    for c in unicode_string:
-        try:
-            retval += b_(chr(_pdfDocEncoding_rev[c]))
-        except KeyError:
-            raise UnicodeEncodeError("pdfdocencoding", c, -1, -1,
-                                     "does not exist in translation table")
-    return retval
+    return codecs.charmap_encode(unicode_string, "strict",
+                                 _pdfDocEncoding_map)[0]
 
 
 def decode_pdfdocencoding(byte_array):
-    retval = u_('')
-    for b in byte_array:
-        c = _pdfDocEncoding[ord_(b)]
-        if c == u_('\u0000'):
-            raise UnicodeDecodeError("pdfdocencoding", utils.barray(b), -1, -1,
-                                     "does not exist in translation table")
-        retval += c
-    return retval
+    return codecs.charmap_decode(byte_array, "strict",
+                                 _pdfDocEncoding_table)[0]
 
 _pdfDocEncoding = (
     u_('\u0000'), u_('\u0000'), u_('\u0000'), u_('\u0000'),
@@ -1099,3 +1167,9 @@ for i in xrange(256):
         continue
     assert char not in _pdfDocEncoding_rev
     _pdfDocEncoding_rev[char] = i
+
+# Tables of the charmap codec functions, undefined characters being mapped to
+# U+FFFE.
+_pdfDocEncoding_table = u_("").join(
+    [c != u_("\u0000") and c or u_("\ufffe") for c in _pdfDocEncoding])
+_pdfDocEncoding_map = codecs.charmap_build(_pdfDocEncoding_table)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2006, Mathieu Fenniak
+# Copyright (c) 2013, Jean Schurger <jean@schurger.org>
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Inventory and extraction of image XObjects.
+"""
+
+import filters
+from generic import IndirectObject
+from utils import b_
+
+# Filters producing image file formats rather than samples, with the file
+# extension of their encoded data when it is a complete file by itself.
+# Image extraction passes their data through instead of decoding it.
+IMAGE_FILTERS = {
+    "/DCTDecode": ".jpg",
+    "/JPXDecode": ".jp2",
+    "/JBIG2Decode": None,
+    "/CCITTFaxDecode": None,
+}
+
+
+##
+# Describes an image XObject used by a page.  The description is taken from
+# the image dictionary only: building it neither decodes nor copies the image
+# data.
+# <p>
+# The attributes are:
+# <ul>
+# <li>name - the resource name of the image, e.g. "/Im0".</li>
+# <li>width, height - the size of the image in samples.</li>
+# <li>colorSpace - the /ColorSpace entry, a name or an array, or None for
+#     image masks.</li>
+# <li>bitsPerComponent - the /BitsPerComponent entry, or None.</li>
+# <li>imageMask - whether the image is a stencil mask.</li>
+# <li>filters - the names of the filters of the image data, in decoding
+#     order.</li>
+# <li>indirectRef - the indirect reference to the image, or None for a direct
+#     object.  Images shared between pages have the same reference.</li>
+# <li>stream - the image stream object itself.</li>
+# </ul>
+class PageImage(object):
+    def __init__(self, name, stream, indirectRef=None):
+        self.name = name
+        self.stream = stream
+        self.indirectRef = indirectRef
+        self.width = stream.get("/Width")
+        self.height = stream.get("/Height")
+        self.imageMask = bool(stream.get("/ImageMask", False))
+        self.colorSpace = stream.get("/ColorSpace")
+        self.bitsPerComponent = stream.get("/BitsPerComponent")
+        self._chain = filters.getFilterChain(stream)
+        self.filters = [f for f, parms in self._chain]
+
+    def __repr__(self):
+        return "PageImage(%s, %sx%s, %s, %s)" % (
+            self.name, self.width, self.height, self.colorSpace, self.filters)
+
+    def _imageFilterIndex(self):
+        for i, (name, parms) in enumerate(self._chain):
+            if name in IMAGE_FILTERS:
+                return i
+        return None
+
+    ##
+    # Returns the name of the image format filter of the image, e.g.
+    # "/DCTDecode", or None if the image data decodes to raw samples.
+    def getImageFilter(self):
+        i = self._imageFilterIndex()
+        if i is None:
+            return None
+        return self._chain[i][0]
+
+    ##
+    # Returns the file extension matching {@link #PageImage.getRawData
+    # getRawData}, e.g. ".jpg" for a JPEG image, or None if the raw data is
+    # not a file format of its own.
+    def getExtension(self):
+        imageFilter = self.getImageFilter()
+        if imageFilter is None:
+            return None
+        return IMAGE_FILTERS[imageFilter]
+
+    ##
+    # Returns the image data in its image format, without decoding it: a
+    # JPEG image is returned byte for byte as stored in the PDF file.  Filters
+    # applied on top of the image format, e.g. [/FlateDecode /DCTDecode], are
+    # decoded.  For images without an image format filter, the data is
+    # returned as stored, i.e. still encoded by its filters.
+    def getRawData(self):
+        i = self._imageFilterIndex()
+        if i is None or i == 0:
+            return self.stream._data
+        return filters.decodeStreamData(self.stream, self._chain[:i])
+
+    ##
+    # Returns the decoded samples of the image.
+    # @exception NotImplementedError The image uses an image format filter,
+    #            whose data can only be obtained with
+    #            {@link #PageImage.getRawData getRawData}.
+    def getData(self):
+        return b_("").join(self.iterData())
+
+    ##
+    # Yields the decoded samples of the image in chunks.  See
+    # {@link #PageImage.getData getData}.
+    def iterData(self):
+        imageFilter = self.getImageFilter()
+        if imageFilter is not None:
+            raise NotImplementedError("cannot decode %s images, use "
+                                      "getRawData" % imageFilter)
+        return self.stream.iterData()
+
+
+##
+# Returns the images used by a page, including the ones drawn by its form
+# XObjects.  Inline images are not included.
+def getPageImages(page):
+    images = []
+    for name, value in page._iterXObjects():
+        stream = value.getObject()
+        if stream.get("/Subtype") != "/Image":
+            continue
+        indirectRef = None
+        if isinstance(value, IndirectObject):
+            indirectRef = value
+        images.append(PageImage(name, stream, indirectRef))
+    return images
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2006, Mathieu Fenniak
+# Copyright (c) 2013, Jean Schurger <jean@schurger.org>
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Imposition of pages on sheets, e.g. 2-up, 4-up and booklet layouts.
+"""
+
+from matrix import Matrix
+
+
+##
+# Describes how pages are placed on the sheets of an imposed document: the
+# sheet size, a grid of cells filled left to right then top to bottom, and
+# how each page is fitted in its cell.
+#
+# @param width  The width of the sheets, in default user space units.
+# @param height The height of the sheets.
+# @param columns Number of cells per row.
+# @param rows Number of rows of cells.
+# @param rotation Clockwise rotation of the pages in their cell, in degrees.
+#                 Must be an increment of 90 degrees.
+# @param scale Scaling factor of the pages, or None to scale each page to fit
+#              its cell, keeping its aspect ratio.
+# @param margin Blank space around the grid.
+# @param spacing Blank space between the cells.
+class Layout(object):
+    def __init__(self, width, height, columns=2, rows=1, rotation=0,
+                 scale=None, margin=0, spacing=0):
+        assert rotation % 90 == 0
+        self.width = float(width)
+        self.height = float(height)
+        self.columns = columns
+        self.rows = rows
+        self.rotation = rotation
+        self.scale = scale
+        self.margin = float(margin)
+        self.spacing = float(spacing)
+
+    ##
+    # Returns the number of pages placed on each sheet.
+    def getCellCount(self):
+        return self.columns * self.rows
+
+    ##
+    # Returns the rectangle of a cell, as a (x, y, width, height) tuple.
+    def getCell(self, index):
+        width = (self.width - 2 * self.margin -
+                 (self.columns - 1) * self.spacing) / self.columns
+        height = (self.height - 2 * self.margin -
+                  (self.rows - 1) * self.spacing) / self.rows
+        column = index % self.columns
+        row = index // self.columns
+        x = self.margin + column * (width + self.spacing)
+        y = self.height - self.margin - (row + 1) * height - \
+            row * self.spacing
+        return x, y, width, height
+
+    ##
+    # Returns the transformation matrix placing a page in a cell.  The page
+    # is rotated, scaled and centered in the cell.
+    #
+    # @param index The index of the cell.
+    # @param box The visible box of the page, e.g. its crop box, as a
+    #            (llx, lly, urx, ury) sequence.
+    # @param rotation Additional clockwise rotation of the page, in degrees,
+    #                 e.g. its /Rotate entry.
+    # @return A {@link #Matrix Matrix}.
+    def getMatrix(self, index, box, rotation=0):
+        x, y, width, height = self.getCell(index)
+        matrix = Matrix.rotation(-(self.rotation + rotation))
+        llx, lly, urx, ury = matrix.transformBox(box)
+        scale = self.scale
+        if scale is None:
+            scale = min(width / (urx - llx), height / (ury - lly))
+        return matrix.multiply(Matrix.scaling(scale, scale)).multiply(
+            Matrix.translation(x + (width - (urx - llx) * scale) / 2 -
+                               llx * scale,
+                               y + (height - (ury - lly) * scale) / 2 -
+                               lly * scale))
+
+
+##
+# Returns the page sequence of a booklet printed 2-up on both sides of the
+# sheets and folded in the middle: for each sheet, the two pages of its front
+# side, then the two pages of its back side.  Blank pages are added at the
+# end to make the number of pages a multiple of 4; they appear as None.
+#
+# @param numPages The number of pages of the document.
+# @return A list of page numbers, to be imposed with a 2 columns layout.
+def bookletSequence(numPages):
+    total = (numPages + 3) // 4 * 4
+    sequence = []
+    for i in range(0, total // 2, 2):
+        for n in (total - 1 - i, i, i + 1, total - 2 - i):
+            if n >= numPages:
+                n = None
+            sequence.append(n)
+    return sequence
+
+
+if __name__ == "__main__":
+    assert bookletSequence(1) == [None, 0, None, None]
+    assert bookletSequence(4) == [3, 0, 1, 2]
+    assert bookletSequence(5) == [None, 0, 1, None, None, 2, 3, 4]
+
+    layout = Layout(200, 100, columns=2, rows=1)
+    assert layout.getCellCount() == 2
+    assert layout.getCell(0) == (0, 0, 100, 100)
+    assert layout.getCell(1) == (100, 0, 100, 100)
+    # a page half the width of its cell is centered in it
+    assert layout.getMatrix(1, (0, 0, 50, 100)) == \
+        Matrix(1, 0, 0, 1, 125, 0)
+    # a landscape page turned upright in a square cell
+    rotated = Layout(200, 100, rotation=90)
+    assert rotated.getMatrix(0, (0, 0, 100, 50)).transformBox(
+        (0, 0, 100, 50)) == (25, 0, 75, 100)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2006, Mathieu Fenniak
+# Copyright (c) 2013, Jean Schurger <jean@schurger.org>
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Affine transformation matrices, as used by the "cm" operator.
+"""
+
+import math
+
+
+##
+# An affine transformation matrix [a b c d e f], mapping a point (x, y) to
+# (a*x + c*y + e, b*x + d*y + f).  The elements are floats.
+class Matrix(object):
+    __slots__ = ("a", "b", "c", "d", "e", "f")
+
+    def __init__(self, a=1, b=0, c=0, d=1, e=0, f=0):
+        self.a = float(a)
+        self.b = float(b)
+        self.c = float(c)
+        self.d = float(d)
+        self.e = float(e)
+        self.f = float(f)
+
+    ##
+    # Returns a matrix translating by tx, ty.
+    def translation(tx, ty):
+        return Matrix(1, 0, 0, 1, tx, ty)
+    translation = staticmethod(translation)
+
+    ##
+    # Returns a matrix scaling by sx horizontally and sy vertically.
+    def scaling(sx, sy):
+        return Matrix(sx, 0, 0, sy, 0, 0)
+    scaling = staticmethod(scaling)
+
+    ##
+    # Returns a matrix rotating counter-clockwise by angle degrees.  The
+    # matrix is exact for increments of 90 degrees.
+    def rotation(angle):
+        if angle % 90 == 0:
+            quarter = int(angle // 90) % 4
+            cos, sin = ((1, 0), (0, 1), (-1, 0), (0, -1))[quarter]
+        else:
+            angle = math.radians(angle)
+            cos, sin = math.cos(angle), math.sin(angle)
+        return Matrix(cos, sin, -sin, cos, 0, 0)
+    rotation = staticmethod(rotation)
+
+    ##
+    # Returns the matrix applying this transformation, then other.  This is
+    # the matrix resulting from the "cm" operator of this matrix followed by
+    # the "cm" operator of other in a content stream.
+    def multiply(self, other):
+        return Matrix(self.a * other.a + self.b * other.c,
+                      self.a * other.b + self.b * other.d,
+                      self.c * other.a + self.d * other.c,
+                      self.c * other.b + self.d * other.d,
+                      self.e * other.a + self.f * other.c + other.e,
+                      self.e * other.b + self.f * other.d + other.f)
+
+    ##
+    # Returns the inverse transformation.
+    # @exception ValueError The matrix is not invertible.
+    def inverse(self):
+        det = self.a * self.d - self.b * self.c
+        if det == 0:
+            raise ValueError("matrix is not invertible")
+        return Matrix(self.d / det, -self.b / det,
+                      -self.c / det, self.a / det,
+                      (self.c * self.f - self.d * self.e) / det,
+                      (self.b * self.e - self.a * self.f) / det)
+
+    ##
+    # Returns the transformed point as a (x, y) tuple.
+    def transformPoint(self, x, y):
+        return (self.a * x + self.c * y + self.e,
+                self.b * x + self.d * y + self.f)
+
+    ##
+    # Returns the bounding box of a transformed rectangle.
+    # @param box The rectangle, as a (llx, lly, urx, ury) sequence.
+    # @return A (llx, lly, urx, ury) tuple.
+    def transformBox(self, box):
+        llx, lly, urx, ury = [float(v) for v in box]
+        points = [self.transformPoint(x, y)
+                  for x in (llx, urx) for y in (lly, ury)]
+        xs = [x for x, y in points]
+        ys = [y for x, y in points]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def isIdentity(self):
+        return tuple(self) == (1, 0, 0, 1, 0, 0)
+
+    def __iter__(self):
+        return iter((self.a, self.b, self.c, self.d, self.e, self.f))
+
+    def __len__(self):
+        return 6
+
+    def __getitem__(self, index):
+        return (self.a, self.b, self.c, self.d, self.e, self.f)[index]
+
+    def __eq__(self, other):
+        return isinstance(other, Matrix) and tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "Matrix(%r, %r, %r, %r, %r, %r)" % tuple(self)
+
+
+if __name__ == "__main__":
+    # transformations are applied in the order of the "cm" operators
+    translate = Matrix.translation(10, 20)
+    scale = Matrix.scaling(2, 3)
+    assert translate.multiply(scale).transformPoint(1, 1) == (22, 63)
+    assert scale.multiply(translate).transformPoint(1, 1) == (12, 23)
+    assert Matrix(2, 0, 0, 4, 6, 8).inverse() == \
+        Matrix(0.5, 0, 0, 0.25, -3, -2)
+    assert translate.multiply(translate.inverse()).isIdentity()
+    try:
+        Matrix(1, 2, 2, 4).inverse()
+        assert False
+    except ValueError:
+        pass
+    assert Matrix.rotation(90) == Matrix(0, 1, -1, 0, 0, 0)
+    assert Matrix.rotation(180) == Matrix(-1, 0, 0, -1, 0, 0)
+    assert Matrix.rotation(-90) == Matrix.rotation(270) == \
+        Matrix(0, -1, 1, 0, 0, 0)
+    assert Matrix.rotation(450) == Matrix.rotation(90)
+    assert Matrix.rotation(90).transformBox((0, 0, 10, 20)) == \
+        (-20, 0, 0, 10)
+    assert translate.transformBox([0, 0, 10, 20]) == (10, 20, 20, 40)
@@ -30,106 +30,193 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 from StringIO import StringIO
+from hashlib import md5
 
-import math
+import re
 import utils
+import filters
 from generic import DictionaryObject, NameObject, NullObject
-from generic import RectangleObject, NumberObject, readObject
+from generic import RectangleObject, NumberObject
 from generic import DecodedStreamObject, ArrayObject, FloatObject
-from generic import TextStringObject
-from utils import readNonWhitespace
+from generic import EncodedStreamObject
+from generic import IndirectObject, StreamObject
 from rectangle import createRectangleAccessor
+from images import getPageImages
+from content_stream import parseContentStream, renameOperandNames
+from matrix import Matrix
+from text import TextExtractor
+from classifier import PageClassifier
 
 
+# Suffixes added to resource names by renaming.
+_renamedSuffix = re.compile(r"(renamed)+$|_\d+$")
+
+
+##
+# Returns a digest of the structure and data of a resource, following
+# indirect references, so that identical copies of a resource, e.g. the same
+# font read from two files, have the same fingerprint.
+#
+# The fingerprints of the objects read from a document are kept by its
+# reader, in its resourceFingerprints dictionary, so that a resource merged
+# with many pages, e.g. a font and its embedded font file, is hashed once.
+#
+# @param memo A dictionary caching the fingerprints of the objects by id.
+def _fingerprint(obj, memo):
+    return _fingerprintWithin(obj, memo, [])[0]
+
+
+##
+# Returns the fingerprint of an object reached from the objects of a stack,
+# along with the lowest depth in the stack referenced by a back-edge of the
+# object, or None if the object only refers to itself and its descendants.
+# Back-edges are encoded by their distance in the stack, so that the
+# fingerprint of an object that only refers to itself does not depend on the
+# path leading to it; the other fingerprints depend on the objects being
+# traversed and are not cached.
+def _fingerprintWithin(obj, memo, stack):
+    if isinstance(obj, IndirectObject):
+        fingerprints = getattr(obj.pdf, "resourceFingerprints", None)
+        if fingerprints is not None:
+            key = (obj.idnum, obj.generation)
+            fingerprint = fingerprints.get(key)
+            if fingerprint is not None:
+                return fingerprint, None
+            fingerprint, reach = _fingerprintWithin(obj.getObject(), memo,
+                    stack)
+            if reach is None:
+                fingerprints[key] = fingerprint
+            return fingerprint, reach
+    obj = obj.getObject()
+    key = id(obj)
+    if key in memo:
+        return memo[key], None
+    if key in stack:
+        depth = stack.index(key)
+        return "cycle %d" % (len(stack) - depth), depth
+    depth = len(stack)
+    reach = None
+    if isinstance(obj, DictionaryObject) or isinstance(obj, ArrayObject):
+        stack.append(key)
+        if isinstance(obj, DictionaryObject):
+            entries = []
+            for k, v in obj.items():
+                if k == "/Length" and isinstance(obj, StreamObject):
+                    continue
+                fingerprint, r = _fingerprintWithin(v, memo, stack)
+                entries.append("%s %s" % (k, fingerprint))
+                if r is not None and (reach is None or r < reach):
+                    reach = r
+            entries.sort()
+            text = "<<%s>>" % " ".join(entries)
+            if isinstance(obj, StreamObject):
+                text += "stream " + md5(obj._data).hexdigest()
+        else:
+            items = []
+            for v in obj:
+                fingerprint, r = _fingerprintWithin(v, memo, stack)
+                items.append(fingerprint)
+                if r is not None and (reach is None or r < reach):
+                    reach = r
+            text = "[%s]" % " ".join(items)
+        stack.pop()
+        if reach is not None and reach >= depth:
+            reach = None
+    else:
+        out = StringIO()
+        obj.writeToStream(out, None)
+        text = type(obj).__name__ + " " + out.getvalue()
+    fingerprint = md5(text).hexdigest()
+    if reach is None:
+        memo[key] = fingerprint
+    return fingerprint, reach
+
+
+##
+# The content stream of a page, i.e. the sequence of operators drawing it.
+# Parsing is deferred until the operations are accessed: until then the
+# decoded data is kept as is, and data added at the beginning or the end of the
+# stream with {@link #ContentStream.prependData prependData} and {@link
+# #ContentStream.appendData appendData} is kept as byte fragments, spliced in
+# when the stream is written.  Wrapping a content stream, e.g. in "q" and "Q"
+# operators, therefore does not require parsing it.
 class ContentStream(DecodedStreamObject):
     def __init__(self, stream, pdf):
         self.pdf = pdf
-        self.operations = []
         # stream may be a StreamObject or an ArrayObject containing
         # multiple StreamObjects to be cat'd together.
+        self._parts = ContentStream._getParts(stream)
+        self._operations = None
+
+    ##
+    # Returns the decoded data of the parts of a content stream, i.e. of a
+    # stream or of each stream of an array of streams.
+    def _getParts(stream):
         stream = stream.getObject()
         if isinstance(stream, ArrayObject):
-            data = ""
-            for s in stream:
-                data += s.getObject().getData()
-            stream = StringIO(data)
+            return [s.getObject().getData() for s in stream]
         else:
-            stream = StringIO(stream.getData())
-        self.__parseContentStream(stream)
+            return [stream.getData()]
+    _getParts = staticmethod(_getParts)
 
-    def __parseContentStream(self, stream):
-        stream.seek(0, 0)
-        operands = []
-        while True:
-            peek = readNonWhitespace(stream)
-            if peek == '':
-                break
-            stream.seek(-1, 1)
-            if peek.isalpha() or peek == "'" or peek == '"':
-                operator = ""
-                while True:
-                    tok = stream.read(1)
-                    if tok.isspace() or tok in NameObject.delimiterCharacters:
-                        stream.seek(-1, 1)
-                        break
-                    elif tok == '':
-                        break
-                    operator += tok
-                if operator == "BI":
-                    # begin inline image - a completely different parsing
-                    # mechanism is required, of course... thanks buddy...
-                    assert operands == []
-                    ii = self._readInlineImage(stream)
-                    self.operations.append((ii, "INLINE IMAGE"))
-                else:
-                    self.operations.append((operands, operator))
-                    operands = []
-            elif peek == '%':
-                # If we encounter a comment in the content stream, we have to
-                # handle it here.  Typically, readObject will handle
-                # encountering a comment -- but readObject assumes that
-                # following the comment must be the object we're trying to
-                # read.  In this case, it could be an operator instead.
-                while peek not in ('\r', '\n'):
-                    peek = stream.read(1)
-            else:
-                operands.append(readObject(stream, None))
+    def _getOperations(self):
+        if self._operations is None:
+            self._operations = []
+            self.__parseContentStream(self._parts)
+            self._parts = None
+        return self._operations
 
-    def _readInlineImage(self, stream):
-        # begin reading just after the "BI" - begin image
-        # first read the dictionary of settings.
-        settings = DictionaryObject()
-        while True:
-            tok = readNonWhitespace(stream)
-            stream.seek(-1, 1)
-            if tok == "I":
-                # "ID" - begin of image data
-                break
-            key = readObject(stream, self.pdf)
-            tok = readNonWhitespace(stream)
-            stream.seek(-1, 1)
-            value = readObject(stream, self.pdf)
-            settings[key] = value
-        # left at beginning of ID
-        tmp = stream.read(3)
-        assert tmp[:2] == "ID"
-        data = ""
-        while True:
-            tok = stream.read(1)
-            if tok == "E":
-                next = stream.read(1)
-                if next == "I":
-                    break
-                else:
-                    stream.seek(-1, 1)
-                    data += tok
-            else:
-                data += tok
-        readNonWhitespace(stream)
-        stream.seek(-1, 1)
-        return {"settings": settings, "data": data}
+    def _setOperations(self, operations):
+        self._operations = operations
+        self._parts = None
+
+    ##
+    # The list of (operands, operator) pairs of the stream.  Accessing it
+    # parses the stream.
+    operations = property(_getOperations, _setOperations)
+
+    ##
+    # Returns whether the stream has been parsed.
+    def isParsed(self):
+        return self._operations is not None
+
+    ##
+    # Adds data at the beginning of the stream.
+    # @param data Content stream data, made of complete operations.
+    def prependData(self, data):
+        if self._operations is None:
+            self._parts.insert(0, data)
+        else:
+            operations = []
+            self.__parseContentStream([data], operations)
+            self._operations[:0] = operations
+
+    ##
+    # Adds data at the end of the stream.
+    # @param data Content stream data, made of complete operations.
+    def appendData(self, data):
+        if self._operations is None:
+            self._parts.append(data)
+        else:
+            self.__parseContentStream([data])
+
+    def __parseContentStream(self, parts, operations=None):
+        # The parts of a content stream form one logical stream, in which
+        # the boundaries between parts separate tokens like whitespace does
+        # (section 3.7.1 of the PDF reference).  Parsing them in sequence,
+        # with the pending operands carried over from one part to the next,
+        # avoids building a concatenated copy of the data.
+        if operations is None:
+            operations = self._operations
+        operands = []
+        for data in parts:
+            operands = parseContentStream(data, operations, operands,
+                                          self.pdf)
 
     def _getData(self):
+        if self._operations is None:
+            # not parsed: the parts, delimited like in an array of streams
+            return "\n".join(self._parts)
         newdata = StringIO()
         for operands, operator in self.operations:
             if operator == "INLINE IMAGE":
@@ -149,7 +236,8 @@ class ContentStream(DecodedStreamObject):
         return newdata.getvalue()
 
     def _setData(self, value):
-        self.__parseContentStream(StringIO(value))
+        self._parts = [value]
+        self._operations = None
 
     _data = property(_getData, _setData)
 
@@ -168,6 +256,10 @@ class PageObject(DictionaryObject):
         # Stores the original indirect reference
         # to this object in its source PDF
         self.indirectRef = indirectRef
+        # Matrix of the transformations not applied to the content yet
+        self._transformation = None
+        # (/Contents, text runs) of the last extractTextRuns call
+        self._textRuns = None
 
     ##
     # Returns a new blank page.
@@ -224,20 +316,58 @@ class PageObject(DictionaryObject):
         self[NameObject("/Rotate")] = NumberObject(currentAngle + angle)
 
     def _mergeResources(res1, res2, resource):
+        # Resources of page2 are shared with the existing resources when they
+        # are the same object, or identical copies of it, e.g. the same font
+        # read from two files.  Otherwise conflicting names get a numbered
+        # suffix, which is not appended again on repeated merges.
         newRes = DictionaryObject()
         newRes.update(res1.get(resource, DictionaryObject()).getObject())
         page2Res = res2.get(resource, DictionaryObject()).getObject()
         renameRes = {}
+        memo = {}
+        index = {}
         for key in page2Res.keys():
-            if key in newRes and newRes[key] != page2Res[key]:
-                newname = NameObject(key + "renamed")
-                renameRes[key] = newname
-                newRes[newname] = page2Res[key]
-            elif key not in newRes:
-                newRes[key] = page2Res.raw_get(key)
+            value = page2Res.raw_get(key)
+            if key in newRes:
+                existing = newRes.raw_get(key)
+                if existing == value or \
+                        existing.getObject() is value.getObject():
+                    continue
+            elif isinstance(value, IndirectObject) and \
+                    value in newRes.values():
+                # another name for an object which is there already
+                newRes[key] = value
+                continue
+            if not index:
+                for name, v in newRes.items():
+                    index.setdefault(_fingerprint(v, memo), name)
+            fingerprint = _fingerprint(value, memo)
+            name = index.get(fingerprint)
+            if name is None:
+                name = key
+                if key in newRes:
+                    name = PageObject._uniqueName(key, newRes, page2Res)
+                newRes[name] = value
+                index[fingerprint] = name
+            if name != key:
+                renameRes[key] = name
         return newRes, renameRes
     _mergeResources = staticmethod(_mergeResources)
 
+    def _uniqueName(name, *dicts):
+        # Returns name with a numbered suffix, unused in dicts.
+        base = _renamedSuffix.sub("", name) or name
+        i = 1
+        while True:
+            newName = NameObject("%s_%d" % (base, i))
+            for d in dicts:
+                if newName in d:
+                    break
+            else:
+                return newName
+            i += 1
+    _uniqueName = staticmethod(_uniqueName)
+
     def _contentStreamRename(stream, rename, pdf):
         if not rename:
             return stream
@@ -255,32 +385,223 @@ class PageObject(DictionaryObject):
         # of a content stream.  This isolates it from changes such as
         # transformation matricies.
         stream = ContentStream(contents, pdf)
-        stream.operations.insert(0, [[], "q"])
-        stream.operations.append([[], "Q"])
+        stream.prependData("q")
+        stream.appendData("Q")
         return stream
     _pushPopGS = staticmethod(_pushPopGS)
 
-    def _addTransformationMatrix(contents, pdf, ctm):
-        # adds transformation matrix at the beginning of the given
-        # contents stream.
-        a, b, c, d, e, f = ctm
-        contents = ContentStream(contents, pdf)
-        contents.operations.insert(0, [[FloatObject(a), FloatObject(b),
-                                        FloatObject(c), FloatObject(d),
-                                        FloatObject(e), FloatObject(f)],
-                                   " cm"])
-        return contents
-    _addTransformationMatrix = staticmethod(_addTransformationMatrix)
+    def _ctmData(ctm):
+        # content stream data of a "cm" operator, its operands written as
+        # FloatObject writes them
+        out = StringIO()
+        for x in ctm:
+            FloatObject(x).writeToStream(out, None)
+            out.write(" ")
+        out.write("cm")
+        return out.getvalue()
+    _ctmData = staticmethod(_ctmData)
+
+    def _dataStream(data):
+        stream = DecodedStreamObject()
+        stream.setData(data)
+        return stream
+    _dataStream = staticmethod(_dataStream)
+
+    ##
+    # Returns the parts of the /Contents of this page as stored, i.e. as
+    # indirect references to content streams in most cases.
+    def _getContentParts(self):
+        self._applyTransformation()
+        if "/Contents" not in self:
+            return []
+        contents = self.raw_get("/Contents")
+        if isinstance(contents.getObject(), ArrayObject):
+            return list(contents.getObject())
+        return [contents]
+
+    ##
+    # Returns the parts of the /Contents of this page, with operand names
+    # renamed.  Parts in which nothing is renamed are returned as stored.
+    def _getRenamedContentParts(self, rename):
+        parts = []
+        for part in self._getContentParts():
+            if rename:
+                data = part.getObject().getData()
+                newData = renameOperandNames(data, rename)
+                if newData is not data:
+                    part = PageObject._dataStream(newData)
+            parts.append(part)
+        return parts
 
     ##
     # Returns the /Contents object, or None if it doesn't exist.
     # /Contents is optionnal, as described in PDF Reference  7.7.3.3
     def getContents(self):
+        self._applyTransformation()
         if "/Contents" in self:
             return self["/Contents"].getObject()
         else:
             return None
 
+    ##
+    # Yields (name, XObject) pairs for the XObjects used by this page,
+    # including those used by its form XObjects, recursively.  Each XObject is
+    # yielded once, as stored in its resource dictionary, i.e. possibly as an
+    # indirect reference.
+    def _iterXObjects(self):
+        seen = set()
+        resources = [self.get("/Resources")]
+        while resources:
+            res = resources.pop()
+            if res is None:
+                continue
+            xobjects = res.getObject().get("/XObject")
+            if xobjects is None:
+                continue
+            for name, value in xobjects.getObject().items():
+                xobject = value.getObject()
+                if id(xobject) in seen:
+                    continue
+                seen.add(id(xobject))
+                yield name, value
+                if xobject.get("/Subtype") == "/Form":
+                    resources.append(xobject.get("/Resources"))
+
+    ##
+    # Returns the streams drawn by this page: its content streams and the form
+    # XObjects it uses.
+    def _getDrawnStreams(self):
+        streams = []
+        contents = self.getContents()
+        if isinstance(contents, ArrayObject):
+            streams.extend([part.getObject() for part in contents])
+        elif contents is not None:
+            streams.append(contents)
+        for name, value in self._iterXObjects():
+            xobject = value.getObject()
+            if xobject.get("/Subtype") == "/Form":
+                streams.append(xobject)
+        return streams
+
+    ##
+    # Decodes the content streams and form XObjects of this page in a pool of
+    # threads, filling the decoded stream cache of the PDF file it was read
+    # from.  See {@link #PdfFileReader.decodeStreams
+    # PdfFileReader.decodeStreams}.
+    #
+    # @param workers Number of threads, defaults to the number of CPUs.
+    # @return The total size of the decoded data.
+    def decodeStreams(self, workers=None):
+        return filters.decodeStreams(self._getDrawnStreams(), workers)
+
+    ##
+    # Lists the image XObjects used by this page, including those drawn by its
+    # form XObjects, without decoding them.  Inline images are not included.
+    # @return A list of {@link #PageImage PageImage} instances.
+    def getImages(self):
+        return getPageImages(self)
+
+    ##
+    # Creates a Form XObject drawing this page, e.g. to be used as a stamp with
+    # {@link #PageObject.mergeStamp mergeStamp}.  The form uses the resources
+    # of the page, and its crop box as bounding box.  To be shared by several
+    # pages, it must be added to the output file as an indirect object, see
+    # {@link #PdfFileWriter.addFormXObject PdfFileWriter.addFormXObject}.
+    # @return A stream object.
+    def createFormXObject(self):
+        form = DecodedStreamObject()
+        form[NameObject("/Type")] = NameObject("/XObject")
+        form[NameObject("/Subtype")] = NameObject("/Form")
+        form[NameObject("/BBox")] = RectangleObject(list(self.cropBox))
+        if "/Resources" in self:
+            form[NameObject("/Resources")] = self.raw_get("/Resources")
+        parts = self._getContentParts()
+        if len(parts) == 1 and \
+                isinstance(parts[0].getObject(), EncodedStreamObject):
+            # a single encoded stream is used as is, without decoding it
+            stream = parts[0].getObject()
+            encoded = EncodedStreamObject()
+            encoded.pdf = stream.pdf
+            encoded._data = stream._data
+            for key in ("/Filter", "/DecodeParms"):
+                if key in stream:
+                    encoded[NameObject(key)] = stream.raw_get(key)
+            encoded.update(form)
+            return encoded
+        form.setData("\n".join([part.getObject().getData()
+                                for part in parts]))
+        return form
+
+    ##
+    # Adds an XObject to the resources of this page, returning its resource
+    # name.  The resource dictionaries are copied rather than modified, as
+    # they are often shared with other pages.
+    def _addXObject(self, xobject, prefix="/Stamp"):
+        resources = DictionaryObject()
+        if "/Resources" in self:
+            resources.update(self["/Resources"])
+        xobjects = DictionaryObject()
+        if "/XObject" in resources:
+            xobjects.update(resources["/XObject"])
+        for name, value in xobjects.items():
+            if value == xobject:
+                # already there, e.g. when stamping the same page twice
+                return name
+        i = 0
+        while NameObject("%s%d" % (prefix, i)) in xobjects:
+            i += 1
+        name = NameObject("%s%d" % (prefix, i))
+        xobjects[name] = xobject
+        resources[NameObject("/XObject")] = xobjects
+        self[NameObject("/Resources")] = resources
+        return name
+
+    ##
+    # Draws a Form XObject over or under the content of this page.  Unlike
+    # {@link #PageObject.mergePage mergePage}, the content and resources of
+    # the stamp are not copied into the page: the page only gets an
+    # invocation of the form and a resource entry for it, so stamping many
+    # pages with the same form stores the stamp only once in the output file.
+    # Neither content stream is parsed.
+    #
+    # @param stamp An indirect reference to a Form XObject, as returned by
+    #              {@link #PdfFileWriter.addFormXObject
+    #              PdfFileWriter.addFormXObject}.
+    # @param ctm A 6 elements tuple containing the operands of a
+    #            transformation matrix applied to the stamp, or None.
+    # @param underlay Whether the stamp is drawn under the content of this
+    #                 page rather than over it.
+    def mergeStamp(self, stamp, ctm=None, underlay=False):
+        name = self._addXObject(stamp)
+        self._addStampContents(
+            PageObject._dataStream(PageObject._stampData(name, ctm)),
+            PageObject._dataStream("q"), PageObject._dataStream("Q"),
+            underlay)
+
+    def _stampData(name, ctm):
+        # content stream data drawing the XObject name
+        data = "q\n"
+        if ctm is not None:
+            data += PageObject._ctmData(ctm) + "\n"
+        return data + name + " Do\nQ"
+    _stampData = staticmethod(_stampData)
+
+    def _addStampContents(self, stampPart, q, Q, underlay):
+        # Adds stampPart before or after the content streams of this page,
+        # isolating the page content with the q and Q streams.
+        parts = self._getContentParts()
+        newContent = ArrayObject()
+        if underlay:
+            newContent.append(stampPart)
+            newContent.extend(parts)
+        else:
+            if parts:
+                newContent.append(q)
+                newContent.extend(parts)
+                newContent.append(Q)
+            newContent.append(stampPart)
+        self[NameObject("/Contents")] = newContent
+
     ##
     # Merges the content streams of two pages into one.  Resource references
     # (i.e. fonts) are maintained from both pages.  The mediabox/cropbox/etc
@@ -306,12 +627,12 @@ class PageObject(DictionaryObject):
     # @param page2transformation A function which applies a transformation to
     #                            the content stream of page2. Takes: page2
     #                            contents stream. Must return: new contents
-    #                            stream. If omitted, the content stream will
-    #                            not be modified.
+    #                            stream. If omitted, the content streams are
+    #                            merged without being parsed.
     # @param ctm A 6-item list containing the content transformation matrix.
-    #            Although this list could be pulled from the closure of the
-    #            page2transformation function, it is simpler and more
-    #            extensible to have it as a separate parameter.
+    #            Without page2transformation, the content stream of page2 is
+    #            transformed with this matrix; with it, the matrix is only
+    #            used to compute the expanded page size.
     # @param expand Whether the page should be expanded to fit the dimensions
     #               of the page to be merged
     def _mergePage(self, page2, page2transformation=None,
@@ -337,19 +658,40 @@ class PageObject(DictionaryObject):
                 "/ProcSet", ArrayObject()).getObject()).union(
                     frozenset(page2Resources.get(
                         "/ProcSet", ArrayObject()).getObject())))
-        newContentArray = ArrayObject()
-        originalContent = self.getContents()
-        if originalContent is not None:
-            newContentArray.append(PageObject._pushPopGS(
-                originalContent, self.pdf))
-        page2Content = page2.getContents()
-        if page2Content is not None:
-            if page2transformation is not None:
+        if page2transformation is None:
+            # Fast path: the content streams are referenced as they are,
+            # between small streams saving and restoring the graphics state
+            # and applying the transformation matrix, and only the names to
+            # rename are rewritten.  Nothing is parsed.
+            newContent = ArrayObject()
+            originalParts = self._getContentParts()
+            if originalParts:
+                newContent.append(PageObject._dataStream("q"))
+                newContent.extend(originalParts)
+                newContent.append(PageObject._dataStream("Q"))
+            page2Parts = page2._getRenamedContentParts(rename)
+            if page2Parts:
+                if ctm is not None:
+                    newContent.append(PageObject._dataStream(
+                        "q\n" + PageObject._ctmData(ctm)))
+                else:
+                    newContent.append(PageObject._dataStream("q"))
+                newContent.extend(page2Parts)
+                newContent.append(PageObject._dataStream("Q"))
+        else:
+            newContentArray = ArrayObject()
+            originalContent = self.getContents()
+            if originalContent is not None:
+                newContentArray.append(PageObject._pushPopGS(
+                    originalContent, self.pdf))
+            page2Content = page2.getContents()
+            if page2Content is not None:
                 page2Content = page2transformation(page2Content)
-            page2Content = PageObject._contentStreamRename(
-                page2Content, rename, self.pdf)
-            page2Content = PageObject._pushPopGS(page2Content, self.pdf)
-            newContentArray.append(page2Content)
+                page2Content = PageObject._contentStreamRename(
+                    page2Content, rename, self.pdf)
+                page2Content = PageObject._pushPopGS(page2Content, self.pdf)
+                newContentArray.append(page2Content)
+            newContent = ContentStream(newContentArray, self.pdf)
         # if expanding the page to fit a new page,
         # calculate the new media box size
         if expand:
@@ -385,8 +727,7 @@ class PageObject(DictionaryObject):
             self.mediaBox.setLowerLeft(lowerleft)
             self.mediaBox.setUpperRight(upperright)
 
-        self[NameObject('/Contents')] = ContentStream(
-            newContentArray, self.pdf)
+        self[NameObject('/Contents')] = newContent
         self[NameObject('/Resources')] = newResources
 
     ##
@@ -397,9 +738,7 @@ class PageObject(DictionaryObject):
     # @param ctm   A 6 elements tuple containing the operands of the
     #              transformation matrix
     def mergeTransformedPage(self, page2, ctm):
-        self._mergePage(page2, lambda page2Content:
-                        PageObject._addTransformationMatrix(
-                            page2Content, page2.pdf, ctm), ctm)
+        self._mergePage(page2, ctm=ctm)
 
     ##
     # This is similar to mergePage, but the stream to be merged is scaled
@@ -420,12 +759,7 @@ class PageObject(DictionaryObject):
     # @param page2 An instance of {@link #PageObject PageObject} to be merged.
     # @param rotation The angle of the rotation, in degrees
     def mergeRotatedPage(self, page2, rotation):
-        rotation = math.radians(rotation)
-        return self.mergeTransformedPage(page2, [math.cos(rotation),
-                                                 math.sin(rotation),
-                                                 -math.sin(rotation),
-                                                 math.cos(rotation),
-                                                 0, 0])
+        return self.mergeTransformedPage(page2, Matrix.rotation(rotation))
 
     ##
     # This is similar to mergePage, but the stream to be merged is translated
@@ -447,19 +781,9 @@ class PageObject(DictionaryObject):
     # @param rotation The angle of the rotation, in degrees
     # @param factor The scaling factor
     def mergeRotatedScaledPage(self, page2, rotation, scale):
-        rotation = math.radians(rotation)
-        rotating = [[math.cos(rotation), math.sin(rotation), 0],
-                    [-math.sin(rotation), math.cos(rotation), 0],
-                    [0, 0, 1]]
-        scaling = [[scale, 0, 0],
-                   [0, scale, 0],
-                   [0, 0, 1]]
-        ctm = utils.matrixMultiply(rotating, scaling)
-
-        return self.mergeTransformedPage(page2,
-                                         [ctm[0][0], ctm[0][1],
-                                          ctm[1][0], ctm[1][1],
-                                          ctm[2][0], ctm[2][1]])
+        ctm = Matrix.rotation(rotation).multiply(
+            Matrix.scaling(scale, scale))
+        return self.mergeTransformedPage(page2, ctm)
 
     ##
     # This is similar to mergePage, but the stream to be merged is translated
@@ -470,17 +794,9 @@ class PageObject(DictionaryObject):
     # @param tx    The translation on X axis
     # @param tx    The translation on Y axis
     def mergeScaledTranslatedPage(self, page2, scale, tx, ty):
-        translation = [[1, 0, 0],
-                       [0, 1, 0],
-                       [tx, ty, 1]]
-        scaling = [[scale, 0, 0],
-                   [0, scale, 0],
-                   [0, 0, 1]]
-        ctm = utils.matrixMultiply(scaling, translation)
-
-        return self.mergeTransformedPage(page2, [ctm[0][0], ctm[0][1],
-                                                 ctm[1][0], ctm[1][1],
-                                                 ctm[2][0], ctm[2][1]])
+        ctm = Matrix.scaling(scale, scale).multiply(
+            Matrix.translation(tx, ty))
+        return self.mergeTransformedPage(page2, ctm)
 
     ##
     # This is similar to mergePage, but the stream to be merged is translated,
@@ -492,35 +808,42 @@ class PageObject(DictionaryObject):
     # @param rotation The angle of the rotation, in degrees
     # @param scale The scaling factor
     def mergeRotatedScaledTranslatedPage(self, page2, rotation, scale, tx, ty):
-        translation = [[1, 0, 0],
-                       [0, 1, 0],
-                       [tx, ty, 1]]
-        rotation = math.radians(rotation)
-        rotating = [[math.cos(rotation), math.sin(rotation), 0],
-                    [-math.sin(rotation), math.cos(rotation), 0],
-                    [0, 0, 1]]
-        scaling = [[scale, 0, 0],
-                   [0, scale, 0],
-                   [0, 0, 1]]
-        ctm = utils.matrixMultiply(rotating, scaling)
-        ctm = utils.matrixMultiply(ctm, translation)
-
-        return self.mergeTransformedPage(page2, [ctm[0][0], ctm[0][1],
-                                                 ctm[1][0], ctm[1][1],
-                                                 ctm[2][0], ctm[2][1]])
-
-    ##
-    # Applys a transformation matrix the page.
+        ctm = Matrix.rotation(rotation).multiply(
+            Matrix.scaling(scale, scale)).multiply(
+                Matrix.translation(tx, ty))
+        return self.mergeTransformedPage(page2, ctm)
+
+    ##
+    # Applys a transformation matrix the page.  The transformations added in
+    # a row are combined, and applied to the content as a single "cm"
+    # operator when the content is next used or written, so that a chain of
+    # transformations costs no more than one.
     #
     # @param ctm   A 6 elements tuple containing the operands of the
-    #              transformation matrix
+    #              transformation matrix, or a {@link #Matrix Matrix}.
     def addTransformation(self, ctm):
-        originalContent = self.getContents()
-        if originalContent is not None:
-            newContent = PageObject._addTransformationMatrix(
-                originalContent, self.pdf, ctm)
-            newContent = PageObject._pushPopGS(newContent, self.pdf)
-            self[NameObject('/Contents')] = newContent
+        if not isinstance(ctm, Matrix):
+            ctm = Matrix(*ctm)
+        if self._transformation is None:
+            self._transformation = ctm
+        else:
+            self._transformation = self._transformation.multiply(ctm)
+
+    def _applyTransformation(self):
+        # Applies the pending transformation to the content, referencing the
+        # content streams as they are between "q cm" and "Q" streams.
+        matrix = self._transformation
+        if matrix is None:
+            return
+        self._transformation = None
+        parts = self._getContentParts()
+        if parts and not matrix.isIdentity():
+            newContent = ArrayObject()
+            newContent.append(PageObject._dataStream(
+                "q\n" + PageObject._ctmData(matrix)))
+            newContent.extend(parts)
+            newContent.append(PageObject._dataStream("Q"))
+            self[NameObject("/Contents")] = newContent
 
     ##
     # Scales a page by the given factors by appling a transformation
@@ -529,14 +852,10 @@ class PageObject(DictionaryObject):
     # @param sx The scaling factor on horizontal axis
     # @param sy The scaling factor on vertical axis
     def scale(self, sx, sy):
-        self.addTransformation([sx, 0,
-                                0,  sy,
-                                0,  0])
-        self.mediaBox = RectangleObject([
-            float(self.mediaBox.getLowerLeft_x()) * sx,
-            float(self.mediaBox.getLowerLeft_y()) * sy,
-            float(self.mediaBox.getUpperRight_x()) * sx,
-            float(self.mediaBox.getUpperRight_y()) * sy])
+        matrix = Matrix.scaling(sx, sy)
+        self.addTransformation(matrix)
+        self.mediaBox = RectangleObject(
+            list(matrix.transformBox(self.mediaBox)))
 
     ##
     # Scales a page by the given factor by appling a transformation
@@ -556,7 +875,7 @@ class PageObject(DictionaryObject):
         sx = width / (self.mediaBox.getUpperRight_x() -
                       self.mediaBox.getLowerLeft_x())
         sy = height / (self.mediaBox.getUpperRight_y() -
-                       self.mediaBox.getLowerLeft_x())
+                       self.mediaBox.getLowerLeft_y())
         self.scale(sx, sy)
 
     ##
@@ -566,18 +885,24 @@ class PageObject(DictionaryObject):
     # Stability: Added in v1.6, will exist for all future v1.x releases.
     # However, it is possible that this function will perform no action if
     # content stream compression becomes "automatic" for some reason.
-    def compressContentStreams(self):
+    # @param level zlib compression level, from 1 (fastest) to 9 (smallest
+    #              output).  Defaults to zlib's default level.
+    # @param strategy zlib compression strategy.
+    def compressContentStreams(self, level=None, strategy=None):
         content = self.getContents()
         if content is not None:
             if not isinstance(content, ContentStream):
                 content = ContentStream(content, self.pdf)
-            self[NameObject("/Contents")] = content.flateEncode()
+            self[NameObject("/Contents")] = content.flateEncode(level,
+                                                                strategy)
 
     ##
     # Locate all text drawing commands, in the order they are provided in the
-    # content stream, and extract the text.  This works well for some PDF
-    # files, but poorly for others, depending on the generator used.  This will
-    # be refined in the future.  Do not rely on the order of text coming out of
+    # content stream, and extract the text.  The strings are decoded with the
+    # /ToUnicode CMaps and encodings of their fonts, and the text drawn by
+    # form XObjects is included.  This works well for some PDF files, but
+    # poorly for others, depending on the generator used.  This will be
+    # refined in the future.  Do not rely on the order of text coming out of
     # this function, as it will change if this function is made more
     # sophisticated.
     # <p>
@@ -585,35 +910,42 @@ class PageObject(DictionaryObject):
     # be overhauled to provide more ordered text in the future.
     # @return a unicode string object
     def extractText(self):
-        text = u""
-        content = self["/Contents"].getObject()
-        if not isinstance(content, ContentStream):
-            content = ContentStream(content, self.pdf)
-        # Note: we check all strings are TextStringObjects.  ByteStringObjects
-        # are strings where the byte->string encoding was unknown, so adding
-        # them to the text here would be gibberish.
-        for operands, operator in content.operations:
-            if operator == "Tj":
-                _text = operands[0]
-                if isinstance(_text, TextStringObject):
-                    text += _text
-            elif operator == "T*":
-                text += "\n"
-            elif operator == "'":
-                text += "\n"
-                _text = operands[0]
-                if isinstance(_text, TextStringObject):
-                    text += operands[0]
-            elif operator == '"':
-                _text = operands[2]
-                if isinstance(_text, TextStringObject):
-                    text += "\n"
-                    text += _text
-            elif operator == "TJ":
-                for i in operands[0]:
-                    if isinstance(i, TextStringObject):
-                        text += i
-        return text
+        extractor = getattr(self.pdf, "textExtractor", None)
+        if extractor is None:
+            extractor = TextExtractor()
+        return extractor.extractText(self)
+
+    ##
+    # Extracts the text of this page with its position, as a sequence of runs
+    # of text, one for each text showing operator, in the order they are
+    # drawn.  The runs are computed in a single pass over the content and
+    # kept until the content of the page changes.
+    # @return A tuple of {@link #TextRun TextRun} named tuples, i.e. (text,
+    #         x, y, font, size) tuples.
+    def extractTextRuns(self):
+        self._applyTransformation()
+        contents = self.get("/Contents")
+        if self._textRuns is not None and self._textRuns[0] is contents:
+            return self._textRuns[1]
+        extractor = getattr(self.pdf, "textExtractor", None)
+        if extractor is None:
+            extractor = TextExtractor()
+        runs = tuple(extractor.extractTextRuns(self))
+        self._textRuns = (contents, runs)
+        return runs
+
+    ##
+    # Classifies this page by what it draws, e.g. to find blank pages,
+    # without parsing its content streams in full: a page without content is
+    # classified without decoding anything, and the operators of the content
+    # are scanned only until the class of the page is known.
+    # @return "blank", "image-only", "text" or "vector", see the {@link
+    #         #PageClassifier PageClassifier} constants.
+    def classify(self):
+        classifier = getattr(self.pdf, "pageClassifier", None)
+        if classifier is None:
+            classifier = PageClassifier()
+        return classifier.classify(self)
 
     ##
     # A rectangle (RectangleObject), expressed in default user space units,
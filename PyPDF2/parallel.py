@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2006, Mathieu Fenniak
+# Copyright (c) 2013, Jean Schurger <jean@schurger.org>
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Text extraction in a pool of worker processes.
+"""
+
+from multiprocessing import Pool, cpu_count
+from multiprocessing.util import Finalize
+
+from reader import PdfFileReader
+
+# Reader of the worker process, and the file it reads.
+_reader = None
+_file = None
+
+
+def _openDocument(path, index):
+    global _reader, _file
+    _file = open(path, "rb")
+    # closed when the worker exits
+    Finalize(None, _file.close, exitpriority=10)
+    _reader = PdfFileReader(_file, index=index)
+
+
+def _extractText(pageNumbers):
+    return [(pageNumber, _reader.getPage(pageNumber).extractText())
+            for pageNumber in pageNumbers]
+
+
+##
+# Extracts the text of the pages of a PDF file in a pool of worker processes,
+# as with {@link #PageObject.extractText PageObject.extractText}.  The file
+# is read once by the calling process; each worker opens it with the
+# resulting {@link #PdfFileReader.getIndex index}, so that the
+# cross-reference tables and the page tree are not read again, and extracts
+# the text of chunks of consecutive pages.
+#
+# @param path The path of the PDF file.
+# @param pages An iterable of page numbers, e.g. range(100, 200), defaults to
+#              all the pages.
+# @param workers Number of worker processes, defaults to the number of CPUs.
+# @param chunkSize Number of pages sent to a worker at a time.
+# @param ordered Whether the pages are yielded in the order of pages, rather
+#                than as they are completed.
+# @param password The password of an encrypted file.
+# @return An iterator of (page number, unicode string) pairs.
+def iterText(path, pages=None, workers=None, chunkSize=16, ordered=True,
+             password=None):
+    with open(path, "rb") as f:
+        reader = PdfFileReader(f)
+        if password is not None:
+            reader.decrypt(password)
+        if pages is None:
+            pages = range(reader.getNumPages())
+        pages = list(pages)
+        index = reader.getIndex()
+    del reader
+    chunks = [pages[i:i + chunkSize] for i in range(0, len(pages), chunkSize)]
+    if workers is None:
+        workers = cpu_count()
+    pool = Pool(workers, _openDocument, (path, index))
+    try:
+        if ordered:
+            results = pool.imap(_extractText, chunks)
+        else:
+            results = pool.imap_unordered(_extractText, chunks)
+        for chunk in results:
+            for item in chunk:
+                yield item
+    finally:
+        pool.terminate()
@@ -37,6 +37,10 @@ from StringIO import StringIO
 from hashlib import md5
 
 import utils
+import filters
+from cache import DecodedStreamCache
+from text import TextExtractor, TextMatch
+from classifier import PageClassifier
 from utils import b_
 from utils import readNonWhitespace, readUntilWhitespace
 import warnings
@@ -57,6 +61,12 @@ import __builtin__
 __builtin__.UserWarning
 
 
+_inheritablePageAttributes = (NameObject("/Resources"),
+                              NameObject("/MediaBox"),
+                              NameObject("/CropBox"),
+                              NameObject("/Rotate"))
+
+
 def convertToInt(d, size):
     if size > 8:
         raise utils.PdfReadError("invalid size in convertToInt")
@@ -78,8 +88,11 @@ def convertToInt(d, size):
 #               to False.
 # @param warndest Allows redirection of warnings to any open file/stream.
 #               Defauls to the warnings default (sys.stderr)
+# @param index The index of the same file returned by
+#               {@link #PdfFileReader.getIndex getIndex}, used instead of
+#               reading the cross-reference tables and the page tree.
 class PdfFileReader(object):
-    def __init__(self, stream, strict=True, warndest=None):
+    def __init__(self, stream, strict=True, warndest=None, index=None):
         # have to dynamically override the default show
         # warning since there are no public methods that specify
         # the 'file' parameter
@@ -94,7 +107,14 @@ class PdfFileReader(object):
                 pass
         warnings.showwarning = _showwarning
         self.strict = strict
+        self.decodeLimits = filters.DecodeLimits()
+        self.decodedCache = DecodedStreamCache()
+        self.textExtractor = TextExtractor()
+        self.pageClassifier = PageClassifier()
+        # (idnum, generation) -> fingerprint of the resources merged
+        self.resourceFingerprints = {}
         self.flattenedPages = None
+        self._pageIndex = None
         self.resolvedObjects = {}
         self.xrefIndex = 0
         if hasattr(stream, 'mode') and 'b' not in stream.mode:
@@ -105,10 +125,137 @@ class PdfFileReader(object):
             fileobj = open(stream, 'rb')
             stream = StringIO(fileobj.read())
             fileobj.close()
-        self.read(stream)
+        if index is None:
+            self.read(stream)
+        else:
+            self._setIndex(index)
         self.stream = stream
         self._override_encryption = False
 
+    ##
+    # Bounds the amount of data that decoding the streams of this PDF file
+    # may produce, to protect against decompression bombs.  A stream or
+    # document exceeding its limit raises a PdfDecodeLimitError when decoded.
+    # In non-strict mode, truncated and corrupted compressed streams are
+    # decoded as far as possible instead of raising an error.
+    #
+    # @param maxStreamLength Maximum decoded size of a single stream, in
+    #                        bytes, or None for no limit.
+    # @param maxDocumentLength Maximum decoded size of all the streams of the
+    #                          document together, or None for no limit.
+    def setDecodeLimits(self, maxStreamLength=None, maxDocumentLength=None):
+        self.decodeLimits.maxStreamLength = maxStreamLength
+        self.decodeLimits.maxDocumentLength = maxDocumentLength
+
+    ##
+    # Sets the memory budget of the decoded stream cache.  Decoded stream data
+    # is kept in a least-recently-used cache, and streams evicted from it are
+    # decoded again the next time they are accessed.  Statistics on hits,
+    # misses and evictions are available from
+    # <code>decodedCache.getStats()</code>.  A stream decoded again counts
+    # only once towards the document limit set with
+    # {@link #PdfFileReader.setDecodeLimits setDecodeLimits}.
+    #
+    # @param budget Maximum size of the cached decoded data, in bytes.  0
+    #               disables caching.
+    def setDecodedCacheBudget(self, budget):
+        self.decodedCache.setBudget(budget)
+
+    ##
+    # Decodes the content streams and form XObjects of a range of pages in a
+    # pool of threads, ahead of their use.  The decoded data is stored in the
+    # decoded stream cache, so only as much as fits in its budget (see
+    # {@link #PdfFileReader.setDecodedCacheBudget setDecodedCacheBudget}) is
+    # retained.  Reading the objects from the file is done in the calling
+    # thread; only the decoding itself runs in the workers.
+    #
+    # @param pages An iterable of page numbers, defaults to all the pages.
+    # @param workers Number of threads, defaults to the number of CPUs.
+    # @return The total size of the decoded data.
+    # @exception PdfReadError A stream could not be decoded.
+    def decodeStreams(self, pages=None, workers=None):
+        if pages is None:
+            pages = range(self.getNumPages())
+        streams = []
+        for pageNumber in pages:
+            streams.extend(self.getPage(pageNumber)._getDrawnStreams())
+        return filters.decodeStreams(streams, workers)
+
+    ##
+    # Iterates over the image XObjects of a range of pages, without decoding
+    # them.  See {@link #PageObject.getImages PageObject.getImages}.
+    #
+    # @param pages An iterable of page numbers, defaults to all the pages.
+    # @param unique When true, an image shared by several pages is only
+    #               reported for the first of them.
+    # @return An iterator of (page number, {@link #PageImage PageImage})
+    #         pairs.
+    def iterImages(self, pages=None, unique=False):
+        if pages is None:
+            pages = range(self.getNumPages())
+        seen = set()
+        for pageNumber in pages:
+            for image in self.getPage(pageNumber).getImages():
+                if unique:
+                    key = id(image.stream)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                yield pageNumber, image
+
+    ##
+    # Iterates over the text of a range of pages, extracted one page at a time
+    # as with {@link #PageObject.extractText PageObject.extractText}.  The
+    # fonts are decoded once for the whole document.
+    #
+    # @param pages An iterable of page numbers, defaults to all the pages.
+    # @return An iterator of (page number, unicode string) pairs.
+    def iterText(self, pages=None):
+        if pages is None:
+            pages = range(self.getNumPages())
+        for pageNumber in pages:
+            yield pageNumber, self.getPage(pageNumber).extractText()
+
+    ##
+    # Classifies a range of pages by what they draw, as with {@link
+    # #PageObject.classify PageObject.classify}, e.g. to find the blank pages
+    # of a document.  The form XObjects shared by the pages are scanned once
+    # for the whole document.
+    #
+    # @param pages An iterable of page numbers, defaults to all the pages.
+    # @return An iterator of (page number, class) pairs.
+    def classifyPages(self, pages=None):
+        if pages is None:
+            pages = range(self.getNumPages())
+        for pageNumber in pages:
+            yield pageNumber, self.getPage(pageNumber).classify()
+
+    ##
+    # Searches the text of a range of pages for a phrase or a regular
+    # expression, see {@link #TextExtractor.search TextExtractor.search}.
+    # Pages are searched one at a time as the matches are consumed, and the
+    # text of a page is only extracted up to its first match, so that taking
+    # the first match of the iterator only extracts the text needed to find
+    # it.
+    #
+    # @param pattern The phrase, or the regular expression, as a string.
+    # @param pages An iterable of page numbers, defaults to all the pages.
+    # @param regex Whether pattern is a regular expression.
+    # @param ignoreCase Whether the search is case insensitive.
+    # @param allMatches Whether to find all the matches of each page rather
+    #                   than the first one only.
+    # @return An iterator of {@link #TextMatch TextMatch} tuples, i.e. (page
+    #         number, start, end, text).
+    def search(self, pattern, pages=None, regex=False, ignoreCase=False,
+               allMatches=False):
+        if pages is None:
+            pages = range(self.getNumPages())
+        for pageNumber in pages:
+            page = self.getPage(pageNumber)
+            for start, end, text in self.textExtractor.search(
+                    page, pattern, regex, ignoreCase, allMatches):
+                yield TextMatch(pageNumber, start, end, text)
+
     ##
     # Retrieves the PDF file's document information dictionary, if it exists.
     # Note that some PDF files use metadata streams instead of docinfo
@@ -192,7 +339,79 @@ class PdfFileReader(object):
         #assert not self.trailer.has_key("/Encrypt")
         if self.flattenedPages is None:
             self._flatten()
-        return self.flattenedPages[pageNumber]
+        page = self.flattenedPages[pageNumber]
+        if page is None:
+            page = self._loadIndexedPage(pageNumber)
+        return page
+
+    ##
+    # Returns the index of this PDF file, i.e. its cross-reference tables,
+    # trailer and the list of its pages, in a form that can be pickled.  A
+    # reader of the same file created with this index does not have to read
+    # them again, e.g. in the worker processes of
+    # {@link #parallel.iterText parallel.iterText}.  If this file has been
+    # decrypted, the decryption key is part of the index.
+    # @return A dictionary.
+    def getIndex(self):
+        if self.flattenedPages is None:
+            self._flatten()
+        memo = {}
+        if self._pageIndex is not None:
+            pages = []
+            for idnum, generation, inherited in self._pageIndex:
+                copy = {}
+                for attr, value in inherited.items():
+                    copy[attr] = _detach(value, memo)
+                pages.append((idnum, generation, copy))
+        else:
+            pages = []
+            for page, attrs in zip(self.flattenedPages,
+                                   self._pageInheritance):
+                if page.indirectRef is None:
+                    # a page which is not an indirect object cannot be found
+                    # without the page tree
+                    pages = None
+                    break
+                inherited = {}
+                for attr in attrs:
+                    inherited[attr] = _detach(page.raw_get(attr), memo)
+                pages.append((page.indirectRef.idnum,
+                              page.indirectRef.generation, inherited))
+        return {
+            "xref": self.xref,
+            "xref_objStm": self.xref_objStm,
+            "xrefIndex": self.xrefIndex,
+            "trailer": _detach(self.trailer, memo),
+            "pages": pages,
+            "decryptionKey": getattr(self, "_decryption_key", None),
+        }
+
+    def _setIndex(self, index):
+        self.xref = index["xref"]
+        self.xref_objStm = index["xref_objStm"]
+        self.xrefIndex = index["xrefIndex"]
+        memo = {}
+        self.trailer = _attach(index["trailer"], self, memo)
+        if index["decryptionKey"] is not None:
+            self._decryption_key = index["decryptionKey"]
+        if index["pages"] is not None:
+            self._pageIndex = [(idnum, generation,
+                                _attach(inherited, self, memo))
+                               for idnum, generation, inherited
+                               in index["pages"]]
+            # pages are only read when requested
+            self.flattenedPages = [None] * len(self._pageIndex)
+
+    def _loadIndexedPage(self, pageNumber):
+        idnum, generation, inherited = self._pageIndex[pageNumber]
+        indirectRef = IndirectObject(idnum, generation, self)
+        page = PageObject(self, indirectRef)
+        page.update(indirectRef.getObject())
+        for attr, value in inherited.items():
+            if attr not in page:
+                page[attr] = value
+        self.flattenedPages[pageNumber] = page
+        return page
 
     ##
     # Read-only property that accesses the
@@ -321,19 +540,17 @@ class PdfFileReader(object):
         self.getNumPages, self.getPage), None, None)
 
     def _flatten(self, pages=None, inherit=None, indirectRef=None):
-        inheritablePageAttributes = (NameObject("/Resources"),
-                                     NameObject("/MediaBox"),
-                                     NameObject("/CropBox"),
-                                     NameObject("/Rotate"))
         if inherit is None:
             inherit = dict()
         if pages is None:
             self.flattenedPages = []
+            # names of the attributes each page inherits
+            self._pageInheritance = []
             catalog = self.trailer["/Root"].getObject()
             pages = catalog["/Pages"].getObject()
         t = pages["/Type"]
         if t == "/Pages":
-            for attr in inheritablePageAttributes:
+            for attr in _inheritablePageAttributes:
                 if attr in pages:
                     inherit[attr] = pages[attr]
             for page in pages["/Kids"]:
@@ -342,14 +559,17 @@ class PdfFileReader(object):
                     addt["indirectRef"] = page
                 self._flatten(page.getObject(), inherit, **addt)
         elif t == "/Page":
+            inherited = []
             for attr, value in inherit.items():
                 # if the page has it's own value, it does not inherit the
                 # parent's value:
                 if attr not in pages:
                     pages[attr] = value
+                    inherited.append(attr)
             pageObj = PageObject(self, indirectRef)
             pageObj.update(pages)
             self.flattenedPages.append(pageObj)
+            self._pageInheritance.append(inherited)
 
     def getObject(self, indirectReference):
         retval = self.resolvedObjects.get(indirectReference.generation,
@@ -479,6 +699,12 @@ class PdfFileReader(object):
         self.resolvedObjects.setdefault(generation, {})
         self.resolvedObjects[generation][idnum] = obj
 
+    ##
+    # Drops an object from the objects read, e.g. once it has been copied to
+    # another file, so that it is read again if it is needed.
+    def uncacheIndirectObject(self, generation, idnum):
+        self.resolvedObjects.get(generation, {}).pop(idnum, None)
+
     def read(self, stream):
         # start at the end:
         stream.seek(-1, 2)
@@ -785,3 +1011,40 @@ class PdfFileReader(object):
     # Note that this property, if true, will remain true even after the {@link
     # #PdfFileReader.decrypt decrypt} function is called.
     isEncrypted = property(lambda self: self.getIsEncrypted(), None, None)
+
+
+def _detach(obj, memo):
+    # Copies obj for pickling, without the references to the reader in its
+    # indirect references.  Objects shared by several pages are copied once.
+    key = id(obj)
+    if key in memo:
+        return memo[key]
+    if isinstance(obj, IndirectObject):
+        copy = IndirectObject(obj.idnum, obj.generation, None)
+    elif isinstance(obj, DictionaryObject) and \
+            not isinstance(obj, StreamObject):
+        copy = DictionaryObject()
+        for k, v in obj.items():
+            copy[k] = _detach(v, memo)
+    elif isinstance(obj, ArrayObject):
+        copy = ArrayObject([_detach(v, memo) for v in obj])
+    else:
+        copy = obj
+    memo[key] = copy
+    return copy
+
+
+def _attach(obj, pdf, memo):
+    # Binds the indirect references of an object copied by _detach to pdf.
+    if id(obj) in memo:
+        return obj
+    memo[id(obj)] = obj
+    if isinstance(obj, IndirectObject):
+        obj.pdf = pdf
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            _attach(v, pdf, memo)
+    elif isinstance(obj, list):
+        for v in obj:
+            _attach(v, pdf, memo)
+    return obj
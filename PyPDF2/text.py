@@ -0,0 +1,920 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2006, Mathieu Fenniak
+# Copyright (c) 2013, Jean Schurger <jean@schurger.org>
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Text extraction, decoding strings with the encodings and /ToUnicode CMaps of
+the fonts.
+"""
+
+import binascii
+import codecs
+import math
+import re
+import warnings
+from collections import namedtuple
+
+from content_stream import parseContentStream, parseContentStreamChunks
+from generic import IndirectObject, NameObject, DictionaryObject
+from generic import TextStringObject, ByteStringObject
+from generic import _pdfDocEncoding_table
+from matrix import Matrix
+from utils import PdfReadWarning
+
+# Undefined characters of the encoding tables.
+_UNDEFINED = u"\ufffe"
+
+
+def _codecTable(codec):
+    chars = []
+    for i in range(256):
+        try:
+            chars.append(chr(i).decode(codec))
+        except UnicodeDecodeError:
+            chars.append(_UNDEFINED)
+    return u"".join(chars)
+
+# Glyph names of the printable ASCII characters.
+_ASCII_NAMES = (
+    "space exclam quotedbl numbersign dollar percent ampersand quotesingle "
+    "parenleft parenright asterisk plus comma hyphen period slash zero one "
+    "two three four five six seven eight nine colon semicolon less equal "
+    "greater question at A B C D E F G H I J K L M N O P Q R S T U V W X Y Z "
+    "bracketleft backslash bracketright asciicircum underscore grave a b c d "
+    "e f g h i j k l m n o p q r s t u v w x y z braceleft bar braceright "
+    "asciitilde").split()
+
+# Glyph names of WinAnsiEncoding from 0x80, None where undefined.
+_WIN_ANSI_NAMES = (
+    "Euro None quotesinglbase florin quotedblbase ellipsis dagger daggerdbl "
+    "circumflex perthousand Scaron guilsinglleft OE None Zcaron None None "
+    "quoteleft quoteright quotedblleft quotedblright bullet endash emdash "
+    "tilde trademark scaron guilsinglright oe None zcaron Ydieresis space "
+    "exclamdown cent sterling currency yen brokenbar section dieresis "
+    "copyright ordfeminine guillemotleft logicalnot hyphen registered macron "
+    "degree plusminus twosuperior threesuperior acute mu paragraph "
+    "periodcentered cedilla onesuperior ordmasculine guillemotright "
+    "onequarter onehalf threequarters questiondown Agrave Aacute Acircumflex "
+    "Atilde Adieresis Aring AE Ccedilla Egrave Eacute Ecircumflex Edieresis "
+    "Igrave Iacute Icircumflex Idieresis Eth Ntilde Ograve Oacute "
+    "Ocircumflex Otilde Odieresis multiply Oslash Ugrave Uacute Ucircumflex "
+    "Udieresis Yacute Thorn germandbls agrave aacute acircumflex atilde "
+    "adieresis aring ae ccedilla egrave eacute ecircumflex edieresis igrave "
+    "iacute icircumflex idieresis eth ntilde ograve oacute ocircumflex otilde "
+    "odieresis divide oslash ugrave uacute ucircumflex udieresis yacute "
+    "thorn ydieresis").split()
+
+# Characters of StandardEncoding above 0x7F.
+_STANDARD_HIGH = {
+    0xa1: u"\u00a1", 0xa2: u"\u00a2", 0xa3: u"\u00a3", 0xa4: u"\u2044",
+    0xa5: u"\u00a5", 0xa6: u"\u0192", 0xa7: u"\u00a7", 0xa8: u"\u00a4",
+    0xa9: u"'", 0xaa: u"\u201c", 0xab: u"\u00ab", 0xac: u"\u2039",
+    0xad: u"\u203a", 0xae: u"\ufb01", 0xaf: u"\ufb02", 0xb1: u"\u2013",
+    0xb2: u"\u2020", 0xb3: u"\u2021", 0xb4: u"\u00b7", 0xb6: u"\u00b6",
+    0xb7: u"\u2022", 0xb8: u"\u201a", 0xb9: u"\u201e", 0xba: u"\u201d",
+    0xbb: u"\u00bb", 0xbc: u"\u2026", 0xbd: u"\u2030", 0xbf: u"\u00bf",
+    0xc1: u"`", 0xc2: u"\u00b4", 0xc3: u"\u02c6", 0xc4: u"\u02dc",
+    0xc5: u"\u00af", 0xc6: u"\u02d8", 0xc7: u"\u02d9", 0xc8: u"\u00a8",
+    0xca: u"\u02da", 0xcb: u"\u00b8", 0xcd: u"\u02dd", 0xce: u"\u02db",
+    0xcf: u"\u02c7", 0xd0: u"\u2014", 0xe1: u"\u00c6", 0xe3: u"\u00aa",
+    0xe8: u"\u0141", 0xe9: u"\u00d8", 0xea: u"\u0152", 0xeb: u"\u00ba",
+    0xf1: u"\u00e6", 0xf5: u"\u0131", 0xf8: u"\u0142", 0xf9: u"\u00f8",
+    0xfa: u"\u0153", 0xfb: u"\u00df",
+}
+
+
+def _standardTable():
+    chars = [_UNDEFINED] * 256
+    for i in range(0x20, 0x7f):
+        chars[i] = unichr(i)
+    chars[0x27] = u"\u2019"
+    chars[0x60] = u"\u2018"
+    for code, char in _STANDARD_HIGH.items():
+        chars[code] = char
+    return u"".join(chars)
+
+# The predefined encodings of simple fonts, as 256 characters strings.
+ENCODINGS = {
+    "/StandardEncoding": _standardTable(),
+    "/WinAnsiEncoding": _codecTable("cp1252"),
+    "/MacRomanEncoding": _codecTable("mac_roman"),
+    "/PDFDocEncoding": _pdfDocEncoding_table,
+}
+
+
+def _glyphNames():
+    names = {}
+    for i, name in enumerate(_ASCII_NAMES):
+        names[name] = unichr(0x20 + i)
+    winAnsi = ENCODINGS["/WinAnsiEncoding"]
+    for i, name in enumerate(_WIN_ANSI_NAMES):
+        if name != "None":
+            names.setdefault(name, winAnsi[0x80 + i])
+    names.update({
+        "quoteright": u"\u2019", "quoteleft": u"\u2018",
+        "fraction": u"\u2044", "fi": u"\ufb01", "fl": u"\ufb02",
+        "ff": u"\ufb00", "ffi": u"\ufb03", "ffl": u"\ufb04",
+        "dotlessi": u"\u0131", "Lslash": u"\u0141", "lslash": u"\u0142",
+        "breve": u"\u02d8", "dotaccent": u"\u02d9", "ring": u"\u02da",
+        "hungarumlaut": u"\u02dd", "ogonek": u"\u02db", "caron": u"\u02c7",
+        "minus": u"\u2212", "nbspace": u"\u00a0", "sfthyphen": u"\u00ad",
+    })
+    return names
+
+# Glyph name -> text, for the glyphs of the predefined encodings.
+_GLYPH_NAMES = _glyphNames()
+
+_uniNameRe = re.compile(r"uni((?:[0-9A-F]{4})+)$")
+_uNameRe = re.compile(r"u([0-9A-F]{4,6})$")
+
+
+##
+# Returns the text of a glyph name, e.g. from the /Differences of a font
+# encoding, or None if unknown.  Besides the names of the predefined
+# encodings, this understands the uniXXXX and uXXXX[XX] conventions and
+# ligatures such as f_f_i.
+def glyphText(name):
+    if name.startswith("/"):
+        name = name[1:]
+    text = _GLYPH_NAMES.get(name)
+    if text is not None:
+        return text
+    name = name.split(".")[0]
+    if "_" in name:
+        parts = [glyphText(part) for part in name.split("_")]
+        if None in parts:
+            return None
+        return u"".join(parts)
+    text = _GLYPH_NAMES.get(name)
+    if text is not None:
+        return text
+    m = _uniNameRe.match(name)
+    if m is not None:
+        hexCodes = m.group(1)
+        return u"".join([unichr(int(hexCodes[i:i + 4], 16))
+                         for i in range(0, len(hexCodes), 4)])
+    m = _uNameRe.match(name)
+    if m is not None:
+        try:
+            return unichr(int(m.group(1), 16))
+        except ValueError:
+            # outside of the range of this narrow Python build
+            return None
+    if len(name) == 1:
+        return unicode(name)
+    return None
+
+_cmapSectionRe = re.compile(
+    r"begin(codespacerange|bfchar|bfrange)(.*?)end\1", re.DOTALL)
+_cmapTokenRe = re.compile(r"<([0-9A-Fa-f\s]*)>|/([^\s/<>\[\]()]+)|(\[)|(\])")
+
+
+def _hexBytes(text):
+    text = "".join(text.split())
+    if len(text) % 2:
+        text += "0"
+    return binascii.unhexlify(text)
+
+
+def _utf16(data):
+    return data.decode("utf-16-be", "replace")
+
+
+##
+# A /ToUnicode CMap, mapping the character codes of a font to text.
+#
+# @param data The data of the CMap stream.
+class CMap(object):
+    def __init__(self, data):
+        # (low, high) byte strings of the codespace ranges
+        self.codespace = []
+        # code -> text
+        self.mapping = {}
+        for m in _cmapSectionRe.finditer(data):
+            tokens = []
+            for hexString, name, start, end in \
+                    _cmapTokenRe.findall(m.group(2)):
+                if start:
+                    tokens.append("[")
+                elif end:
+                    tokens.append("]")
+                elif name:
+                    tokens.append(glyphText(name) or u"")
+                else:
+                    tokens.append(_hexBytes(hexString))
+            getattr(self, "_read_" + m.group(1))(tokens)
+        lengths = set([len(low) for low, high in self.codespace])
+        if not lengths:
+            lengths = set([len(code) for code in self.mapping]) or set([1])
+        self.codeLengths = sorted(lengths)
+
+    def _read_codespacerange(self, tokens):
+        for i in range(0, len(tokens) - 1, 2):
+            self.codespace.append((tokens[i], tokens[i + 1]))
+
+    def _read_bfchar(self, tokens):
+        for i in range(0, len(tokens) - 1, 2):
+            text = tokens[i + 1]
+            if not isinstance(text, unicode):
+                text = _utf16(text)
+            self.mapping[tokens[i]] = text
+
+    def _read_bfrange(self, tokens):
+        i = 0
+        while i + 2 < len(tokens):
+            low, high, dest = tokens[i], tokens[i + 1], tokens[i + 2]
+            i += 3
+            size = len(low)
+            first = int(binascii.hexlify(low) or "0", 16)
+            last = int(binascii.hexlify(high) or "0", 16)
+            if dest == "[":
+                # one destination per code
+                code = first
+                while i < len(tokens) and tokens[i] != "]":
+                    text = tokens[i]
+                    if not isinstance(text, unicode):
+                        text = _utf16(text)
+                    self.mapping[_codeBytes(code, size)] = text
+                    code += 1
+                    i += 1
+                i += 1
+            elif not isinstance(dest, unicode) and dest:
+                # consecutive destinations from dest
+                destSize = len(dest)
+                value = int(binascii.hexlify(dest), 16)
+                for code in range(first, last + 1):
+                    self.mapping[_codeBytes(code, size)] = \
+                        _utf16(_codeBytes(value + code - first, destSize))
+
+    ##
+    # Splits a string into character codes, following the codespace ranges.
+    def splitCodes(self, data):
+        if len(self.codeLengths) == 1:
+            size = self.codeLengths[0]
+            if size == 1:
+                return list(data)
+            return [data[i:i + size] for i in range(0, len(data), size)]
+        codes = []
+        pos = 0
+        while pos < len(data):
+            for size in self.codeLengths:
+                code = data[pos:pos + size]
+                if len(code) == size and self._inCodespace(code):
+                    break
+            else:
+                code = data[pos:pos + 1]
+            codes.append(code)
+            pos += len(code)
+        return codes
+
+    def _inCodespace(self, code):
+        for low, high in self.codespace:
+            if len(low) == len(code) and low <= code <= high:
+                return True
+        return False
+
+    ##
+    # Returns the text of a string shown with the font of this CMap.  Codes
+    # without mapping are left out.
+    def decode(self, data):
+        get = self.mapping.get
+        return u"".join([get(code, u"") for code in self.splitCodes(data)])
+
+
+def _codeBytes(value, size):
+    return binascii.unhexlify("%0*x" % (2 * size, value))[-size:]
+
+
+##
+# Decodes the strings shown with a font: with its /ToUnicode CMap when it has
+# one, and for simple fonts with their encoding, i.e. a predefined encoding
+# modified by /Differences, for the codes the CMap does not map.
+#
+# @param font The font dictionary.
+# @param cmap The {@link #CMap CMap} of the font, or None.
+class FontDecoder(object):
+    def __init__(self, font, cmap=None):
+        self.cmap = cmap
+        self.composite = font.get("/Subtype") == "/Type0"
+        self.name = None
+        if "/BaseFont" in font:
+            self.name = font["/BaseFont"]
+        self._font = font
+        self._table = None
+        # code -> width, read when first needed
+        self._widths = None
+        self._defaultWidth = 0
+        if not self.composite:
+            table = list(self._getEncoding(font))
+            if cmap is not None:
+                for code, text in cmap.mapping.items():
+                    if len(code) == 1:
+                        table[ord(code)] = text
+            if [text for text in table if len(text) != 1]:
+                # a codec table maps codes to single characters only
+                mapping = {}
+                for code, text in enumerate(table):
+                    if text != _UNDEFINED:
+                        mapping[code] = text
+                self._table = mapping
+            else:
+                self._table = u"".join(table)
+
+    def _getEncoding(self, font):
+        base = "/StandardEncoding"
+        if font.get("/Subtype") == "/TrueType":
+            base = "/WinAnsiEncoding"
+        differences = None
+        encoding = font.get("/Encoding")
+        if encoding is not None:
+            encoding = encoding.getObject()
+        if isinstance(encoding, NameObject):
+            base = encoding
+        elif isinstance(encoding, DictionaryObject):
+            base = encoding.get("/BaseEncoding", base)
+            differences = encoding.get("/Differences")
+        table = ENCODINGS.get(base, ENCODINGS["/StandardEncoding"])
+        if differences is None:
+            return table
+        table = list(table)
+        code = 0
+        for item in differences.getObject():
+            item = item.getObject()
+            if isinstance(item, NameObject):
+                text = glyphText(item)
+                if text is not None and 0 <= code < 256:
+                    table[code] = text
+                code += 1
+            else:
+                code = int(item)
+        return table
+
+    ##
+    # Returns the text of a string shown with this font.
+    # @param data The bytes of the string.
+    def decode(self, data):
+        if self.composite:
+            if self.cmap is None:
+                return u""
+            return self.cmap.decode(data)
+        return codecs.charmap_decode(data, "ignore", self._table)[0]
+
+    ##
+    # Returns the character codes of a string shown with this font.
+    def getCodes(self, data):
+        if not self.composite:
+            return list(data)
+        if self.cmap is not None:
+            return self.cmap.splitCodes(data)
+        return [data[i:i + 2] for i in range(0, len(data), 2)]
+
+    ##
+    # Returns the width of a string shown with this font, in thousandths of a
+    # text space unit, the number of character codes it is made of, and the
+    # number of single byte spaces, to which word spacing applies.
+    # @return A (width, codes, spaces) tuple.
+    def getWidth(self, data):
+        if self._widths is None:
+            self._readWidths()
+        widths = self._widths
+        default = self._defaultWidth
+        total = 0.0
+        if not self.composite:
+            for c in data:
+                total += widths.get(ord(c), default)
+            return total, len(data), data.count(" ")
+        codes = self.getCodes(data)
+        for code in codes:
+            total += widths.get(int(binascii.hexlify(code) or "0", 16),
+                                default)
+        return total, len(codes), codes.count(" ")
+
+    def _readWidths(self):
+        font = self._font
+        self._widths = widths = {}
+        if self.composite:
+            # the codes are taken as CIDs, as with the Identity encodings
+            descendant = font["/DescendantFonts"].getObject()[0].getObject()
+            self._defaultWidth = float(descendant.get("/DW", 1000))
+            w = descendant.get("/W")
+            w = w is not None and w.getObject() or []
+            i = 0
+            while i + 1 < len(w):
+                first = int(w[i])
+                item = w[i + 1].getObject()
+                if isinstance(item, list):
+                    for j, width in enumerate(item):
+                        widths[first + j] = float(width.getObject())
+                    i += 2
+                elif i + 2 < len(w):
+                    width = float(w[i + 2].getObject())
+                    for cid in range(first, int(item) + 1):
+                        widths[cid] = width
+                    i += 3
+                else:
+                    break
+            return
+        scale = 1.0
+        if font.get("/Subtype") == "/Type3" and "/FontMatrix" in font:
+            # glyph space of Type 3 fonts is defined by their font matrix
+            scale = float(font["/FontMatrix"][0]) * 1000
+        if "/Widths" not in font:
+            # standard fonts may have no widths: assume an average width
+            self._defaultWidth = 500.0
+            return
+        first = int(font.get("/FirstChar", 0))
+        for i, width in enumerate(font["/Widths"].getObject()):
+            widths[first + i] = float(width.getObject()) * scale
+        descriptor = font.get("/FontDescriptor")
+        if descriptor is not None:
+            descriptor = descriptor.getObject()
+            if "/MissingWidth" in descriptor:
+                self._defaultWidth = float(descriptor["/MissingWidth"]) * scale
+
+
+##
+# A run of text shown by a text showing operator, with the position of its
+# start point and the size of its font in default user space units.  The
+# font is identified by its /BaseFont, or None.
+TextRun = namedtuple("TextRun", "text x y font size")
+
+
+##
+# A match of a text search: the number of the page, the start and end offsets
+# of the match in the text of the page as returned by
+# {@link #PageObject.extractText PageObject.extractText}, and the matched
+# text.
+TextMatch = namedtuple("TextMatch", "page start end text")
+
+# Number of characters of text already extracted in which a regular
+# expression match may start, when the text it needs is extracted.
+SEARCH_WINDOW = 4096
+
+
+class _TextState(object):
+    # The graphics state parameters positional extraction depends on.
+    __slots__ = ("ctm", "font", "fontSize", "charSpacing", "wordSpacing",
+                 "scaling", "leading", "rise")
+
+    def __init__(self, ctm):
+        self.ctm = ctm
+        self.font = None
+        self.fontSize = 0.0
+        self.charSpacing = 0.0
+        self.wordSpacing = 0.0
+        self.scaling = 1.0
+        self.leading = 0.0
+        self.rise = 0.0
+
+    def copy(self):
+        state = _TextState(self.ctm)
+        for name in _TextState.__slots__:
+            setattr(state, name, getattr(self, name))
+        return state
+
+
+##
+# Extracts the text of pages.  The decoders of the fonts, including their
+# parsed /ToUnicode CMaps, are cached by object, so that the pages of a
+# document sharing fonts only decode and parse them once.  Each
+# {@link #PdfFileReader PdfFileReader} has a text extractor used by
+# {@link #PageObject.extractText PageObject.extractText}.
+class TextExtractor(object):
+    def __init__(self):
+        # object key -> (object, FontDecoder or CMap)
+        self._fonts = {}
+        self._cmaps = {}
+
+    ##
+    # Returns the text of a page as a unicode string, in the order it is
+    # drawn.  Text drawn by form XObjects is included.
+    def extractText(self, page):
+        pieces = []
+        _parsePage(page, _TextCollector(self, _getResources(page), page.pdf,
+                                        pieces.append, ()))
+        return u"".join(pieces)
+
+    ##
+    # Searches the text of a page, as returned by {@link #TextExtractor.
+    # extractText extractText}, for a phrase or a regular expression.  The
+    # text is matched as it is extracted, across the boundaries of the
+    # strings shown, and extraction stops at the first match unless all the
+    # matches are wanted.  The text is searched each time enough of it has
+    # been extracted, rather than for every string shown.  A regular
+    # expression match is reported once text follows it, or at the end of
+    # the page, so that it matches as much as in the full text, and a match
+    # may start at most {@link #SEARCH_WINDOW SEARCH_WINDOW} characters
+    # before the text completing it.
+    #
+    # @param pattern The phrase, or the regular expression, as a string.
+    # @param regex Whether pattern is a regular expression.
+    # @param ignoreCase Whether the search is case insensitive.
+    # @param allMatches Whether to find all the non-overlapping matches
+    #                   rather than the first one only.
+    # @return A list of (start, end, text) tuples.
+    def search(self, page, pattern, regex=False, ignoreCase=False,
+               allMatches=False):
+        flags = re.UNICODE
+        if ignoreCase:
+            flags |= re.IGNORECASE
+        if regex:
+            overlap = SEARCH_WINDOW
+        else:
+            overlap = len(pattern) - 1
+            pattern = re.escape(pattern)
+        matcher = _TextMatcher(re.compile(pattern, flags), overlap,
+                               allMatches, regex)
+        try:
+            _parsePage(page, _TextCollector(self, _getResources(page),
+                                            page.pdf, matcher.feed, ()))
+            matcher.finish()
+        except _StopExtraction:
+            pass
+        return matcher.matches
+
+    ##
+    # Returns the runs of text of a page with their positions, tracking the
+    # text matrix, the text state and the transformation matrix in a single
+    # pass over the content.  Glyph widths are taken from the fonts, so the
+    # positions of runs following one another without positioning operator
+    # are only as accurate as the widths.
+    # @return A list of {@link #TextRun TextRun} tuples.
+    def extractTextRuns(self, page):
+        runs = []
+        operations = []
+        _parsePage(page, operations)
+        self._extractRuns(operations, _getResources(page), page.pdf,
+                          _TextState(Matrix()), runs, ())
+        return runs
+
+    def _extractRuns(self, operations, resources, pdf, state, runs, forms):
+        fonts = resources.get("/Font", DictionaryObject()).getObject()
+        stack = []
+        tm = tlm = Matrix()
+        for operands, operator in operations:
+            if operator in _runOperands:
+                operands = _checkRunOperands(operator, operands)
+                if operands is None:
+                    continue
+            if operator == "Tj" or operator == "TJ":
+                tm = self._showRun(operands[0], state, tm, runs)
+            elif operator == "Td" or operator == "TD":
+                tx, ty = operands[0], operands[1]
+                if operator == "TD":
+                    state.leading = -ty
+                tm = tlm = Matrix.translation(tx, ty).multiply(tlm)
+            elif operator == "Tm":
+                tm = tlm = Matrix(*operands[:6])
+            elif operator == "T*":
+                tm = tlm = Matrix.translation(
+                    0, -state.leading).multiply(tlm)
+            elif operator == "'" or operator == '"':
+                if operator == '"':
+                    state.wordSpacing = operands[0]
+                    state.charSpacing = operands[1]
+                tm = tlm = Matrix.translation(
+                    0, -state.leading).multiply(tlm)
+                tm = self._showRun(operands[-1], state, tm, runs)
+            elif operator == "BT":
+                tm = tlm = Matrix()
+            elif operator == "Tf":
+                state.font = None
+                if operands[0] in fonts:
+                    state.font = self.getFontDecoder(
+                        fonts.raw_get(operands[0]))
+                state.fontSize = operands[1]
+            elif operator == "Tc":
+                state.charSpacing = operands[0]
+            elif operator == "Tw":
+                state.wordSpacing = operands[0]
+            elif operator == "Tz":
+                state.scaling = operands[0] / 100
+            elif operator == "TL":
+                state.leading = operands[0]
+            elif operator == "Ts":
+                state.rise = operands[0]
+            elif operator == "cm":
+                state.ctm = Matrix(*operands[:6]).multiply(state.ctm)
+            elif operator == "q":
+                stack.append(state.copy())
+            elif operator == "Q":
+                if stack:
+                    state = stack.pop()
+            elif operator == "Do":
+                self._extractFormRuns(operands[0], resources, pdf, state,
+                                      runs, forms)
+
+    def _showRun(self, operand, state, tm, runs):
+        # Adds the run of text shown with the given operand, returning the
+        # text matrix following it.
+        trm = tm.multiply(state.ctm)
+        x, y = trm.transformPoint(0, state.rise)
+        font = state.font
+        pieces = []
+        advance = 0.0
+        if not isinstance(operand, list):
+            operand = [operand]
+        for item in operand:
+            if isinstance(item, (TextStringObject, ByteStringObject)):
+                data = item.original_bytes
+                if font is not None:
+                    pieces.append(font.decode(data))
+                    width, codes, spaces = font.getWidth(data)
+                else:
+                    if isinstance(item, TextStringObject):
+                        pieces.append(item)
+                    width, codes, spaces = 0, len(data), data.count(" ")
+                advance += (width / 1000 * state.fontSize +
+                            state.charSpacing * codes +
+                            state.wordSpacing * spaces) * state.scaling
+            else:
+                try:
+                    adjustment = float(item)
+                except (TypeError, ValueError):
+                    warnings.warn("Invalid TJ array element %r, skipped" %
+                                  (item,), PdfReadWarning)
+                    continue
+                advance -= adjustment / 1000 * state.fontSize * state.scaling
+        text = u"".join(pieces)
+        if text:
+            size = abs(state.fontSize) * math.hypot(trm.c, trm.d)
+            runs.append(TextRun(text, x, y, font and font.name, size))
+        return Matrix.translation(advance, 0).multiply(tm)
+
+    def _extractFormRuns(self, name, resources, pdf, state, runs, forms):
+        form, key = _getForm(name, resources, forms)
+        if form is None:
+            return
+        formResources = resources
+        if "/Resources" in form:
+            formResources = form["/Resources"].getObject()
+        state = state.copy()
+        if "/Matrix" in form:
+            state.ctm = Matrix(*[float(x) for x in form["/Matrix"]]
+                               ).multiply(state.ctm)
+        operations = []
+        parseContentStream(form.getData(), operations, pdf=pdf)
+        self._extractRuns(operations, formResources, pdf, state, runs,
+                          forms + (key,))
+
+    ##
+    # Returns the decoder of a font.
+    # @param font The font dictionary, or an indirect reference to it.
+    # @return A {@link #FontDecoder FontDecoder}.
+    def getFontDecoder(self, font):
+        key = _objectKey(font)
+        cached = self._fonts.get(key)
+        if cached is not None and (cached[0] is font or
+                                   isinstance(font, IndirectObject)):
+            return cached[1]
+        fontObject = font.getObject()
+        cmap = None
+        if "/ToUnicode" in fontObject:
+            cmap = self._getCMap(fontObject.raw_get("/ToUnicode"))
+        decoder = FontDecoder(fontObject, cmap)
+        self._fonts[key] = (font, decoder)
+        return decoder
+
+    def _getCMap(self, stream):
+        key = _objectKey(stream)
+        cached = self._cmaps.get(key)
+        if cached is not None and (cached[0] is stream or
+                                   isinstance(stream, IndirectObject)):
+            return cached[1]
+        cmap = None
+        streamObject = stream.getObject()
+        if hasattr(streamObject, "getData"):
+            cmap = CMap(streamObject.getData())
+        self._cmaps[key] = (stream, cmap)
+        return cmap
+
+    def _extractForm(self, name, resources, pdf, emit, forms):
+        form, key = _getForm(name, resources, forms)
+        if form is None:
+            return
+        formResources = resources
+        if "/Resources" in form:
+            formResources = form["/Resources"].getObject()
+        collector = _TextCollector(self, formResources, pdf, emit,
+                                   forms + (key,))
+        parseContentStream(form.getData(), collector, pdf=pdf)
+
+
+##
+# Receives the operations of a content stream from the parser, in place of
+# its list of operations, and passes the text they show to emit as it goes,
+# so that extraction can stop before the end of the content.
+class _TextCollector(object):
+    def __init__(self, extractor, resources, pdf, emit, forms):
+        self.extractor = extractor
+        self.resources = resources
+        self.fonts = resources.get("/Font", DictionaryObject()).getObject()
+        self.pdf = pdf
+        self.emit = emit
+        self.forms = forms
+        self.font = None
+        self.stack = []
+
+    def append(self, operation):
+        operands, operator = operation
+        if operator == "Tj" or operator == "TJ":
+            if operands:
+                self.show(operands[0])
+        elif operator == "T*":
+            self.emit(u"\n")
+        elif operator == "'":
+            self.emit(u"\n")
+            if operands:
+                self.show(operands[0])
+        elif operator == '"':
+            self.emit(u"\n")
+            if len(operands) > 2:
+                self.show(operands[2])
+        elif operator == "Tf":
+            self.font = None
+            if operands and operands[0] in self.fonts:
+                self.font = self.extractor.getFontDecoder(
+                    self.fonts.raw_get(operands[0]))
+        elif operator == "q":
+            self.stack.append(self.font)
+        elif operator == "Q":
+            if self.stack:
+                self.font = self.stack.pop()
+        elif operator == "Do" and operands:
+            self.extractor._extractForm(operands[0], self.resources, self.pdf,
+                                        self.emit, self.forms)
+
+    def show(self, operand):
+        if isinstance(operand, list):
+            for item in operand:
+                self.show(item)
+        elif self.font is not None:
+            if isinstance(operand, (TextStringObject, ByteStringObject)):
+                self.emit(self.font.decode(operand.original_bytes))
+        elif isinstance(operand, TextStringObject):
+            # no font to decode with: strings that looked like text
+            self.emit(operand)
+
+
+class _StopExtraction(Exception):
+    pass
+
+
+class _TextMatcher(object):
+    # Matches text as it is extracted.  The text is searched each time at
+    # least overlap characters have been added, and at the end, so that each
+    # character is scanned about twice, and only the overlap characters at the
+    # end of the text searched, in which a match may start, are kept.  A match
+    # of an extensible pattern, e.g. a regular expression, reaching the end of
+    # the text searched may grow with the text following it, and is only
+    # reported once some text follows it, or at the end.
+    def __init__(self, pattern, overlap, allMatches, extensible):
+        self.pattern = pattern
+        self.overlap = max(overlap, 0)
+        self.allMatches = allMatches
+        self.extensible = extensible
+        self.matches = []
+        self.tail = u""
+        # text added since the last search
+        self.pending = []
+        self.pendingLength = 0
+        # offset of the tail in the text
+        self.offset = 0
+        # offset from which the next match may start
+        self.next = 0
+
+    def feed(self, text):
+        if not text:
+            return
+        self.pending.append(text)
+        self.pendingLength += len(text)
+        if self.pendingLength >= self.overlap:
+            self._search(False)
+
+    def finish(self):
+        self._search(True)
+
+    def _search(self, final):
+        tail = self.tail + u"".join(self.pending)
+        self.pending = []
+        self.pendingLength = 0
+        search = self.pattern.search
+        cut = len(tail) - self.overlap
+        m = search(tail, max(self.next - self.offset, 0))
+        while m is not None:
+            if self.extensible and not final and m.end() == len(tail):
+                # kept until the text following it is known
+                cut = min(cut, m.start())
+                break
+            self.matches.append((self.offset + m.start(),
+                                 self.offset + m.end(), m.group()))
+            if not self.allMatches:
+                raise _StopExtraction()
+            self.next = self.offset + max(m.end(), m.start() + 1)
+            m = search(tail, self.next - self.offset)
+        if cut > 0:
+            tail = tail[cut:]
+            self.offset += cut
+        self.tail = tail
+
+
+def _parsePage(page, operations):
+    # Parses the content streams of a page one at a time, as they are decoded,
+    # so that an extraction stopping early does not decode the rest.
+    operands = []
+    for part in page._getContentParts():
+        operands = parseContentStreamChunks(part.getObject().iterData(),
+                                            operations, operands,
+                                            page.pdf)
+
+
+def _getResources(obj):
+    if "/Resources" in obj:
+        return obj["/Resources"].getObject()
+    return DictionaryObject()
+
+
+# Number of operands of the text operators handled by
+# TextExtractor._extractRuns, the indices of their numeric operands, and of
+# their name operands.
+_runOperands = {
+    "Tj": (1, (), ()), "TJ": (1, (), ()), "'": (1, (), ()),
+    '"': (3, (0, 1), ()),
+    "Td": (2, (0, 1), ()), "TD": (2, (0, 1), ()),
+    "Tm": (6, range(6), ()), "cm": (6, range(6), ()),
+    "Tf": (2, (1,), (0,)),
+    "Tc": (1, (0,), ()), "Tw": (1, (0,), ()), "Tz": (1, (0,), ()),
+    "TL": (1, (0,), ()), "Ts": (1, (0,), ()),
+    "Do": (1, (), (0,)),
+}
+
+
+def _checkRunOperands(operator, operands):
+    # Returns the operands of a text operator, the numeric ones as floats, or
+    # None with a warning if they are missing or of the wrong type.
+    count, numbers, names = _runOperands[operator]
+    if len(operands) >= count:
+        operands = list(operands[-count:])
+        try:
+            for i in numbers:
+                operands[i] = float(operands[i])
+        except (TypeError, ValueError):
+            pass
+        else:
+            for i in names:
+                if not isinstance(operands[i], NameObject):
+                    break
+            else:
+                return operands
+    warnings.warn("Invalid operands %r of the %s operator, skipped" %
+                  (operands, operator), PdfReadWarning)
+    return None
+
+
+def _getForm(name, resources, forms):
+    # Returns the form XObject of the given resource name and its key, or
+    # None if it is not a form or already being processed.
+    xobjects = resources.get("/XObject", DictionaryObject()).getObject()
+    if name not in xobjects:
+        return None, None
+    form = xobjects.raw_get(name)
+    key = _objectKey(form)
+    form = form.getObject()
+    if key in forms or form.get("/Subtype") != "/Form":
+        return None, None
+    return form, key
+
+
+def _objectKey(obj):
+    # Identifies an object stored in a document, or a direct object, which
+    # the caches keep alive so that its id is not reused.
+    if isinstance(obj, IndirectObject):
+        return (id(obj.pdf), obj.idnum, obj.generation)
+    return id(obj)
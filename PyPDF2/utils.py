@@ -128,6 +128,14 @@ class PdfReadError(PyPdfError):
     pass
 
 
+class PdfStreamError(PdfReadError):
+    pass
+
+
+class PdfDecodeLimitError(PdfReadError):
+    pass
+
+
 class PageSizeNotDefinedError(PyPdfError):
     pass
 
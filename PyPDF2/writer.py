@@ -30,15 +30,24 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import binascii
 from hashlib import md5
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
 import struct
+import zlib
 
-from utils import b_
+from StringIO import StringIO
+import filters
+from utils import b_, PdfStreamError, PdfDecodeLimitError
 from algorithms import _alg33, _alg34, _alg35
 from generic import DictionaryObject, NameObject, ArrayObject, NumberObject
 from generic import IndirectObject, ByteStringObject, StreamObject
+from generic import NullObject
+from generic import EncodedStreamObject, DecodedStreamObject
 from generic import TreeObject, createStringObject
 from page_object import PageObject
+from text import _objectKey
 
 
 ##
@@ -65,6 +74,21 @@ class PdfFileWriter(object):
         root.update({NameObject("/Type"): NameObject("/Catalog"),
                      NameObject("/Pages"): self._pages})
         self._root = self._addObject(root)
+        self._asciiArmor = None
+        self._compression = None
+        self._optimization = None
+        self._objectStreams = None
+        # objects waiting to be written in the next object stream
+        self._packed = []
+        self.optimizationStats = None
+        # state of the file being written by open, flush and close
+        self._output = None
+        self._offsets = None
+        self._externalReferenceMap = None
+        self._pendingPages = None
+        self._reservedPages = None
+        self._visited = None
+        self._copied = None
 
     def _addObject(self, obj):
         self._objects.append(obj)
@@ -85,8 +109,15 @@ class PdfFileWriter(object):
     #               Takes: page list, page to add.
     def _addPage(self, page, action):
         assert page["/Type"] == "/Page"
+        if self._output is not None:
+            # the objects written are released by flush: the page must not
+            # refer to them, e.g. when it is a page of a reader
+            page = _copyPage(page)
         page[NameObject("/Parent")] = self._pages
-        page = self._addObject(page)
+        if self._output is not None:
+            page = self._addStreamedPage(page)
+        else:
+            page = self._addObject(page)
         pages = self.getObject(self._pages)
         action(pages["/Kids"], page)
         pages[NameObject("/Count")] = NumberObject(pages["/Count"] + 1)
@@ -206,6 +237,305 @@ class PdfFileWriter(object):
         self._encrypt = self._addObject(encrypt)
         self._encrypt_key = key
 
+    ##
+    # Adds a page to the output file as a Form XObject, to be drawn on other
+    # pages with {@link #PageObject.mergeStamp PageObject.mergeStamp}.  The
+    # page itself is not added to the document.
+    # @param page The page drawn by the form, e.g. a watermark.
+    # @return An indirect reference to the form.
+    def addFormXObject(self, page):
+        return self._addObject(page.createFormXObject())
+
+    ##
+    # Adds pages of a document, stamped with an overlay or underlay page, in a
+    # single pass.  The stamp is added once as a Form XObject (see
+    # {@link #PageObject.mergeStamp PageObject.mergeStamp}), and the objects
+    # the stamped pages have in common are shared in the output file: the
+    # resource dictionaries extended with the stamp, once per distinct
+    # /Resources object of the input pages, and the small content streams
+    # invoking the stamp.  No content stream is parsed or copied.  The pages
+    # of the reader are left as they are: the pages added are copies of them.
+    #
+    # @param reader A {@link #PdfFileReader PdfFileReader}.
+    # @param stamp The overlay or underlay, a {@link #PageObject PageObject},
+    #              or an indirect reference to a form returned by
+    #              {@link #PdfFileWriter.addFormXObject addFormXObject}.
+    # @param pages An iterable of page numbers, defaults to all the pages.
+    # @param ctm The transformation matrix applied to the stamp, as a 6
+    #            elements tuple, or a function taking a page number and the
+    #            page and returning such a matrix or None.
+    # @param underlay Whether the stamp is drawn under the page content
+    #                 rather than over it.
+    # @return The number of pages added.
+    def addStampedPages(self, reader, stamp, pages=None, ctm=None,
+                        underlay=False):
+        if not isinstance(stamp, IndirectObject):
+            stamp = self.addFormXObject(stamp)
+        if pages is None:
+            pages = range(reader.getNumPages())
+        q = self._addObject(PageObject._dataStream("q"))
+        Q = self._addObject(PageObject._dataStream("Q"))
+        # key of the input /Resources -> (input /Resources, output
+        # /Resources, stamp name), and (stamp name, matrix) -> stream
+        # invoking the stamp.  Holding the input /Resources guarantees that
+        # the id of a direct dictionary is not reused while cached.
+        resourcesCache = {}
+        stampParts = {}
+        count = 0
+        for pageNumber in pages:
+            page = reader.getPage(pageNumber)
+            # stamp a copy of the page dictionary, keeping the page of the
+            # reader unchanged
+            stamped = PageObject(page.pdf, page.indirectRef)
+            stamped.update(page)
+            stamped._transformation = page._transformation
+            page = stamped
+            original = key = None
+            if "/Resources" in page:
+                original = page.raw_get("/Resources")
+                key = _objectKey(original)
+            cached = resourcesCache.get(key)
+            if cached is None:
+                name = page._addXObject(stamp)
+                resources = self._addObject(page["/Resources"])
+                resourcesCache[key] = (original, resources, name)
+            else:
+                resources, name = cached[1:]
+            page[NameObject("/Resources")] = resources
+            if callable(ctm):
+                matrix = ctm(pageNumber, page)
+            else:
+                matrix = ctm
+            partKey = (name, matrix is not None and tuple(matrix))
+            part = stampParts.get(partKey)
+            if part is None:
+                part = self._addObject(PageObject._dataStream(
+                    PageObject._stampData(name, matrix)))
+                stampParts[partKey] = part
+            page._addStampContents(part, q, Q, underlay)
+            self.addPage(page)
+            count += 1
+        return count
+
+    ##
+    # Adds the pages of a document imposed on sheets, e.g. 2-up, 4-up or as a
+    # booklet.  Each page is added once as a Form XObject, shared by all the
+    # sheets it appears on, and each sheet only gets a small content stream
+    # placing the forms in its cells with precomputed matrices.  No content
+    # stream is parsed.
+    #
+    # @param reader A {@link #PdfFileReader PdfFileReader}.
+    # @param layout A {@link #Layout Layout} describing the sheets.
+    # @param sequence An iterable of page numbers placed in the cells of the
+    #                 sheets in order, None leaving a cell blank.  Defaults to
+    #                 all the pages in order; see also
+    #                 {@link #bookletSequence bookletSequence}.
+    # @return The number of sheets added.
+    def addImposedPages(self, reader, layout, sequence=None):
+        if sequence is None:
+            sequence = range(reader.getNumPages())
+        cells = layout.getCellCount()
+        # page number -> (form, crop box, rotation)
+        forms = {}
+        sheets = 0
+        cell = 0
+        xobjects = DictionaryObject()
+        data = []
+        for pageNumber in sequence:
+            if pageNumber is not None:
+                placed = forms.get(pageNumber)
+                if placed is None:
+                    page = reader.getPage(pageNumber)
+                    rotation = 0
+                    if "/Rotate" in page:
+                        rotation = page["/Rotate"]
+                    placed = (self.addFormXObject(page), list(page.cropBox),
+                              rotation)
+                    forms[pageNumber] = placed
+                form, box, rotation = placed
+                name = NameObject("/Page%d" % cell)
+                xobjects[name] = form
+                data.append(PageObject._stampData(
+                    name, layout.getMatrix(cell, box, rotation)))
+            cell += 1
+            if cell == cells:
+                self._addSheet(layout, xobjects, data)
+                sheets += 1
+                cell = 0
+                xobjects = DictionaryObject()
+                data = []
+        if cell:
+            self._addSheet(layout, xobjects, data)
+            sheets += 1
+        return sheets
+
+    def _addSheet(self, layout, xobjects, data):
+        sheet = PageObject.createBlankPage(None, layout.width, layout.height)
+        if xobjects:
+            sheet["/Resources"][NameObject("/XObject")] = xobjects
+        sheet[NameObject("/Contents")] = self._addObject(
+            PageObject._dataStream("\n".join(data)))
+        self.addPage(sheet)
+
+    ##
+    # Makes {@link #PdfFileWriter.write write} produce ASCII-armored output,
+    # by encoding the data of every stream with an ASCII filter on top of its
+    # existing filters.  The resulting file only contains 7-bit characters,
+    # unless it is also encrypted.
+    # @param filterName "/ASCII85Decode", "/ASCIIHexDecode", or None to write
+    # stream data as is (the default).
+    def setAsciiArmor(self, filterName="/ASCII85Decode"):
+        if filterName not in (None, "/ASCII85Decode", "/ASCIIHexDecode"):
+            raise ValueError("unsupported ASCII filter %s" % filterName)
+        self._asciiArmor = filterName
+
+    ##
+    # Makes {@link #PdfFileWriter.write write} compress the streams that do
+    # not use any filter yet with FlateDecode, using the given zlib settings.
+    # This trades CPU time for output size: level 1 is the fastest, level 9
+    # produces the smallest files.
+    # @param level zlib compression level, from 0 to 9, or None to write
+    # uncompressed streams as is (the default).
+    # @param strategy zlib compression strategy, e.g. zlib.Z_FILTERED for
+    # data such as images.
+    def setCompression(self, level=zlib.Z_DEFAULT_COMPRESSION,
+                       strategy=zlib.Z_DEFAULT_STRATEGY):
+        if level is None:
+            self._compression = None
+        else:
+            self._compression = {"level": level, "strategy": strategy}
+
+    ##
+    # Makes {@link #PdfFileWriter.write write} recompress the streams of the
+    # output file in a pool of workers before writing them: FlateDecode
+    # streams are recompressed, keeping their other filters and decode
+    # parameters, and streams without any filter are compressed with
+    # FlateDecode.  A stream keeps its original encoding when the result is
+    # not smaller.  Streams using other filters, e.g. JPEG images, are left
+    # alone.  After writing, the sizes before and after optimization are
+    # available in the <code>optimizationStats</code> dictionary.
+    # @param level zlib compression level, or None to disable the
+    # optimization (the default).
+    # @param strategy zlib compression strategy.
+    # @param workers Number of workers, defaults to the number of CPUs.
+    # @param processes Whether to use a pool of processes instead of threads.
+    # zlib releases the interpreter lock while compressing, so threads
+    # usually suffice and avoid copying the data between processes.
+    def setStreamOptimization(self, level=9,
+                              strategy=zlib.Z_DEFAULT_STRATEGY,
+                              workers=None, processes=False):
+        if level is None:
+            self._optimization = None
+        else:
+            self._optimization = {"level": level, "strategy": strategy,
+                                  "workers": workers,
+                                  "processes": processes}
+
+    def _optimizeStreams(self, indices=None):
+        # Recompresses the streams of self._objects, or those at the given
+        # indices, as configured by setStreamOptimization.  The statistics of
+        # the indices optimized by earlier calls are added up.
+        params = self._optimization
+        if indices is None:
+            indices = xrange(len(self._objects))
+        jobs = []
+        for i in indices:
+            obj = self._objects[i]
+            if not isinstance(obj, StreamObject):
+                continue
+            chain = filters.getFilterChain(obj)
+            if not chain:
+                jobs.append((i, obj.getData(), False))
+            elif chain[0][0] == "/FlateDecode":
+                jobs.append((i, obj._data, True))
+        workers = params["workers"]
+        if workers is None:
+            workers = cpu_count()
+        tasks = []
+        for i, data, inflate in jobs:
+            # streams are inflated within the decode limits of the document
+            # they were read from; a process gets a copy of them
+            obj = self._objects[i]
+            limits = getattr(getattr(obj, "pdf", None), "decodeLimits", None)
+            if limits is not None and getattr(obj, "_decodeCounted", False):
+                # decoded before: the stream counts once towards the
+                # document limit, as in filters.decodeStreamChunks
+                limits = filters.DecodeLimits(limits.maxStreamLength)
+            tasks.append((data, inflate, params["level"], params["strategy"],
+                          limits))
+        if workers <= 1 or len(tasks) <= 1:
+            results = map(_optimizeStreamData, tasks)
+        else:
+            if params["processes"]:
+                pool = Pool(workers)
+            else:
+                pool = ThreadPool(workers)
+            try:
+                results = pool.map(_optimizeStreamData, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        stats = {"streams": len(jobs), "optimized": 0,
+                 "originalSize": 0, "optimizedSize": 0, "bytesSaved": 0}
+        for (i, data, inflate), result in zip(jobs, results):
+            obj = self._objects[i]
+            original = len(data)
+            stats["originalSize"] += original
+            if result is None or len(result) >= original:
+                stats["optimizedSize"] += original
+                continue
+            if inflate:
+                # same filters and parameters, smaller Flate data
+                newobj = EncodedStreamObject()
+                for key, value in obj.items():
+                    if key != "/Length":
+                        newobj[key] = value
+                newobj._data = result
+            else:
+                newobj = obj._encode(NameObject("/FlateDecode"), result)
+            self._objects[i] = newobj
+            stats["optimized"] += 1
+            stats["optimizedSize"] += len(result)
+        stats["bytesSaved"] = stats["originalSize"] - stats["optimizedSize"]
+        if indices is not None and self.optimizationStats is not None:
+            for key, value in self.optimizationStats.items():
+                stats[key] += value
+        self.optimizationStats = stats
+
+    ##
+    # Makes {@link #PdfFileWriter.write write} produce a PDF 1.5 file with
+    # compressed object streams and cross-reference stream: the objects
+    # which are not streams, e.g. dictionaries of pages, annotations,
+    # outlines and destinations, are packed together in FlateDecode
+    # compressed /ObjStm streams instead of being written one by one, and
+    # the cross-reference table is written as a compressed /XRef stream.
+    # This makes files with many small objects much smaller, but they cannot
+    # be read by PDF 1.4 readers.  The streams are compressed with the
+    # settings of {@link #PdfFileWriter.setCompression setCompression}, if
+    # any.
+    # @param limit Maximum number of objects in an object stream, or None to
+    # write every object and the cross-reference table as is (the default).
+    # Larger object streams compress better, but a reader must decode a
+    # whole object stream to read any object of it.
+    def setObjectStreams(self, limit=100):
+        if limit is not None and limit < 1:
+            raise ValueError("an object stream holds at least one object")
+        self._objectStreams = limit
+
+    def _getHeader(self):
+        if self._objectStreams is not None and self._header < b_("%PDF-1.5"):
+            return b_("%PDF-1.5")
+        return self._header
+
+    def _encodeStream(self, obj):
+        # Applies the compression and armor settings to a stream about to be
+        # written.
+        if self._compression is not None and "/Filter" not in obj:
+            obj = obj.flateEncode(**self._compression)
+        if self._asciiArmor is not None:
+            obj = obj.encode(self._asciiArmor)
+        return obj
+
     ##
     # Writes the collection of pages added to this object out as a PDF file.
     # <p>
@@ -213,6 +543,8 @@ class PdfFileWriter(object):
     # @param stream An object to write the file to.  The object must support
     # the write method, and the tell method, similar to a file object.
     def write(self, stream):
+        if self._output is not None:
+            raise ValueError("the file is being written by open and close")
         externalReferenceMap = {}
 
         # PDF objects sometimes have circular references to their /Page objects
@@ -225,6 +557,9 @@ class PdfFileWriter(object):
         # copying in a new copy of the page object.
         for objIndex in xrange(len(self._objects)):
             obj = self._objects[objIndex]
+            if isinstance(obj, PageObject):
+                # pending transformations are written as a "cm" operator
+                obj._applyTransformation()
             if isinstance(obj, PageObject) and obj.indirectRef is not None:
                 data = obj.indirectRef
                 externalReferenceMap.setdefault(data.pdf, {})
@@ -236,36 +571,128 @@ class PdfFileWriter(object):
         self._sweepIndirectReferences(externalReferenceMap, self._root)
         del self.stack
 
+        if self._optimization is not None:
+            self._optimizeStreams()
+
         # Begin writing:
-        object_positions = []
-        stream.write(self._header + b_("\n"))
-        for i in range(len(self._objects)):
-            idnum = (i + 1)
-            obj = self._objects[i]
-            object_positions.append(stream.tell())
-            stream.write(b_(str(idnum) + " 0 obj\n"))
-            key = None
-            if hasattr(self, "_encrypt") and idnum != self._encrypt.idnum:
-                pack1 = struct.pack("<i", i + 1)[:3]
-                pack2 = struct.pack("<i", 0)[:2]
-                key = self._encrypt_key + pack1 + pack2
-                assert len(key) == (len(self._encrypt_key) + 5)
-                md5_hash = md5(key).digest()
-                key = md5_hash[:min(16, len(self._encrypt_key) + 5)]
-            if obj is not None:
-                obj.writeToStream(stream, key)
-                stream.write(b_("\nendobj\n"))
+        offsets = {}
+        stream.write(self._getHeader() + b_("\n"))
+        count = len(self._objects)
+        for i in range(count):
+            self._emitObject(stream, offsets, i + 1, self._objects[i])
+        self._writeTrailer(stream, offsets)
+        # drop the object and cross-reference streams
+        del self._objects[count:]
+
+    def _emitObject(self, stream, offsets, idnum, obj):
+        # Writes an object, or packs it in the next object stream, recording
+        # its offset or its object stream and index in offsets.
+        if self._objectStreams is not None and obj is not None and \
+                not isinstance(obj, StreamObject) and \
+                not (hasattr(self, "_encrypt") and
+                     idnum == self._encrypt.idnum):
+            self._packed.append((idnum, obj))
+            if len(self._packed) >= self._objectStreams:
+                self._writeObjectStream(stream, offsets)
+        else:
+            offsets[idnum] = stream.tell()
+            self._writeObject(stream, idnum, obj)
+
+    def _writeObjectStream(self, stream, offsets):
+        # The objects of an object stream are not encrypted by themselves,
+        # the whole stream is.
+        ref = self._addObject(None)
+        header = []
+        data = StringIO()
+        for index, (idnum, obj) in enumerate(self._packed):
+            header.append("%d %d" % (idnum, data.tell()))
+            obj.writeToStream(data, None)
+            data.write(b_("\n"))
+            offsets[idnum] = (ref.idnum, index)
+        header = b_(" ".join(header) + "\n")
+        objStm = DecodedStreamObject()
+        objStm.update({NameObject("/Type"): NameObject("/ObjStm"),
+                       NameObject("/N"): NumberObject(len(self._packed)),
+                       NameObject("/First"): NumberObject(len(header))})
+        objStm._data = header + data.getvalue()
+        objStm = objStm.flateEncode(**(self._compression or {}))
+        offsets[ref.idnum] = stream.tell()
+        self._writeObject(stream, ref.idnum, objStm)
+        self._packed = []
+
+    def _writeObject(self, stream, idnum, obj):
+        stream.write(b_(str(idnum) + " 0 obj\n"))
+        key = None
+        if hasattr(self, "_encrypt") and idnum != self._encrypt.idnum:
+            pack1 = struct.pack("<i", idnum)[:3]
+            pack2 = struct.pack("<i", 0)[:2]
+            key = self._encrypt_key + pack1 + pack2
+            assert len(key) == (len(self._encrypt_key) + 5)
+            md5_hash = md5(key).digest()
+            key = md5_hash[:min(16, len(self._encrypt_key) + 5)]
+        if obj is not None:
+            if isinstance(obj, StreamObject):
+                obj = self._encodeStream(obj)
+            obj.writeToStream(stream, key)
+            stream.write(b_("\nendobj\n"))
+
+    def _writeTrailer(self, stream, offsets):
+        if self._packed:
+            self._writeObjectStream(stream, offsets)
+        if self._objectStreams is not None:
+            self._writeXRefStream(stream, offsets)
+            return
 
         # xref table
         xref_location = stream.tell()
         stream.write(b_("xref\n"))
         stream.write(b_("0 %s\n" % (len(self._objects) + 1)))
         stream.write(b_("%010d %05d f \n" % (0, 65535)))
-        for offset in object_positions:
-            stream.write(b_("%010d %05d n \n" % (offset, 0)))
+        for idnum in xrange(1, len(self._objects) + 1):
+            stream.write(b_("%010d %05d n \n" % (offsets[idnum], 0)))
 
         # trailer
         stream.write(b_("trailer\n"))
+        trailer = self._trailer()
+        trailer.writeToStream(stream, None)
+
+        # eof
+        stream.write(b_("\nstartxref\n%s\n%%%%EOF\n" % (xref_location)))
+
+    def _writeXRefStream(self, stream, offsets):
+        # The cross-reference stream has an entry for itself, and is never
+        # encrypted.
+        ref = self._addObject(None)
+        xref_location = stream.tell()
+        offsets[ref.idnum] = xref_location
+        # (type, field 2, field 3) for each object
+        entries = [(0, 0, 65535)]
+        for idnum in xrange(1, len(self._objects) + 1):
+            offset = offsets[idnum]
+            if isinstance(offset, tuple):
+                entries.append((2, offset[0], offset[1]))
+            else:
+                entries.append((1, offset, 0))
+        widths = [1, _byteWidth(max(e[1] for e in entries)),
+                  _byteWidth(max(e[2] for e in entries))]
+        formats = ["%%0%dx" % (2 * w) for w in widths]
+        data = binascii.unhexlify("".join(
+            formats[0] % e[0] + formats[1] % e[1] + formats[2] % e[2]
+            for e in entries))
+        xref = DecodedStreamObject()
+        xref.update(self._trailer())
+        xref.update({NameObject("/Type"): NameObject("/XRef"),
+                     NameObject("/W"): ArrayObject(
+                         [NumberObject(w) for w in widths])})
+        xref._data = data
+        xref = self._encodeStream(
+            xref.flateEncode(**(self._compression or {})))
+        stream.write(b_(str(ref.idnum) + " 0 obj\n"))
+        xref.writeToStream(stream, None)
+        stream.write(b_("\nendobj\n"))
+        stream.write(b_("startxref\n%s\n%%%%EOF\n" % (xref_location)))
+
+    def _trailer(self):
         trailer = DictionaryObject()
         trailer.update({NameObject("/Size"): NumberObject(
             len(self._objects) + 1),
@@ -275,10 +702,139 @@ class PdfFileWriter(object):
             trailer[NameObject("/ID")] = self._ID
         if hasattr(self, "_encrypt"):
             trailer[NameObject("/Encrypt")] = self._encrypt
-        trailer.writeToStream(stream, None)
+        return trailer
 
-        # eof
-        stream.write(b_("\nstartxref\n%s\n%%%%EOF\n" % (xref_location)))
+    ##
+    # Starts writing this PDF file to a stream page by page, so that a large
+    # document is produced without holding all its pages in memory: each
+    # page added, with the objects it references and that were not written
+    # yet, is written to the stream when the next page is added or on
+    # {@link #PdfFileWriter.flush flush}, and the objects read from other
+    # documents are then dropped from their readers.  Only the positions of
+    # the objects written and the numbers given to the objects of other
+    # documents are kept.  The document catalog, the page tree, and the
+    # objects the pages do not reference, e.g. bookmarks, are written with
+    # the cross-reference table and the trailer by
+    # {@link #PdfFileWriter.close close}.
+    # <p>
+    # Encryption and stream settings must be set before opening the file.
+    # Once written, pages and the objects they reference can no longer be
+    # accessed or changed, but references to them remain valid, and a page
+    # referencing a page of the same document that is added later, e.g. in
+    # a link, references the page added.
+    # @param stream An object to write the file to.  The object must support
+    # the write method, and the tell method, similar to a file object.
+    def open(self, stream):
+        if self._output is not None:
+            raise ValueError("the file is already open")
+        self._output = stream
+        self._offsets = {}
+        self._externalReferenceMap = {}
+        self._pendingPages = []
+        self._reservedPages = set()
+        self.optimizationStats = None
+        stream.write(self._getHeader() + b_("\n"))
+        # pages added before opening the file are written first
+        for page in self.getObject(self._pages)["/Kids"]:
+            self._objects[page.idnum - 1] = _copyPage(self.getObject(page))
+            self._registerPage(page)
+            self._pendingPages.append(page.idnum)
+
+    def _registerPage(self, ref):
+        # Maps the page of another document the page at ref was read from to
+        # ref, returning the reference to the page if it was reserved by a
+        # page written before.
+        source = getattr(self.getObject(ref), "indirectRef", None)
+        if source is None:
+            return None
+        refs = self._externalReferenceMap.setdefault(
+            source.pdf, {}).setdefault(source.generation, {})
+        reserved = refs.get(source.idnum)
+        if reserved is not None and reserved.idnum in self._reservedPages:
+            self._reservedPages.remove(reserved.idnum)
+            return reserved
+        refs[source.idnum] = ref
+        return None
+
+    def _addStreamedPage(self, page):
+        self.flush()
+        ref = self._addObject(page)
+        reserved = self._registerPage(ref)
+        if reserved is not None:
+            # take the number already referenced by written pages
+            self._objects.pop()
+            self._objects[reserved.idnum - 1] = page
+            ref = reserved
+        self._pendingPages.append(ref.idnum)
+        return ref
+
+    ##
+    # Writes the pages added since the last flush to the file being written,
+    # with the objects they reference that were not written yet; see
+    # {@link #PdfFileWriter.open open}.
+    def flush(self):
+        if self._output is None:
+            raise ValueError("the file is not open")
+        if not self._pendingPages:
+            return
+        count = len(self._objects)
+        self._visited = set()
+        self._copied = []
+        # the page tree, catalog and info are written by close
+        self.stack = [self._pages.idnum, self._root.idnum, self._info.idnum]
+        for idnum in self._pendingPages:
+            self._objects[idnum - 1]._applyTransformation()
+            self._sweepIndirectReferences(self._externalReferenceMap,
+                                          IndirectObject(idnum, 0, self))
+        del self.stack
+        idnums = self._visited.union(xrange(count + 1,
+                                            len(self._objects) + 1))
+        idnums = sorted(idnum for idnum in idnums
+                        if self._objects[idnum - 1] is not None)
+        if self._optimization is not None:
+            self._optimizeStreams([idnum - 1 for idnum in idnums])
+        for idnum in idnums:
+            self._emitObject(self._output, self._offsets, idnum,
+                             self._objects[idnum - 1])
+            self._objects[idnum - 1] = None
+        # the copies written are dropped from the readers, which read the
+        # objects again if they are needed later
+        for pdf, generation, idnum in self._copied:
+            if hasattr(pdf, "uncacheIndirectObject"):
+                pdf.uncacheIndirectObject(generation, idnum)
+        self._visited = None
+        self._copied = None
+        self._pendingPages = []
+
+    ##
+    # Finishes writing the file started by {@link #PdfFileWriter.open open}:
+    # writes the remaining pages and objects, the cross-reference table and
+    # the trailer.  The stream itself is not closed.
+    def close(self):
+        self.flush()
+        stream = self._output
+        self.stack = []
+        self._sweepIndirectReferences(self._externalReferenceMap, self._root)
+        del self.stack
+        if self._optimization is not None:
+            self._optimizeStreams([i for i in xrange(len(self._objects))
+                                   if i + 1 not in self._offsets])
+        if self._packed:
+            # the objects packed by flush have no offset yet
+            self._writeObjectStream(stream, self._offsets)
+        for i in xrange(len(self._objects)):
+            if i + 1 not in self._offsets:
+                obj = self._objects[i]
+                if obj is None:
+                    # a page referenced by a written page but never added
+                    obj = NullObject()
+                self._emitObject(stream, self._offsets, i + 1, obj)
+        self._writeTrailer(stream, self._offsets)
+        self._output = None
+        self._offsets = None
+        self._externalReferenceMap = None
+        self._pendingPages = None
+        self._reservedPages = None
 
     def _sweepIndirectReferences(self, externMap, data):
         if isinstance(data, DictionaryObject):
@@ -305,6 +861,8 @@ class PdfFileWriter(object):
                 if data.idnum in self.stack:
                     return data
                 else:
+                    if self._visited is not None:
+                        self._visited.add(data.idnum)
                     self.stack.append(data.idnum)
                     realdata = self.getObject(data)
                     self._sweepIndirectReferences(externMap, realdata)
@@ -322,6 +880,14 @@ class PdfFileWriter(object):
                     externMap[data.pdf].setdefault(data.generation, {})
                     externMap[data.pdf][data.generation][data.idnum] = \
                         newobj_ido
+                    if self._copied is not None:
+                        if isinstance(newobj, DictionaryObject) and \
+                                newobj.get("/Type") == "/Page":
+                            # reserved for the page until it is added
+                            self._reservedPages.add(idnum)
+                            return newobj_ido
+                        self._copied.append((data.pdf, data.generation,
+                                             data.idnum))
                     newobj = self._sweepIndirectReferences(externMap, newobj)
                     self._objects[idnum-1] = newobj
                     return newobj_ido
@@ -458,3 +1024,86 @@ class PdfFileWriter(object):
 
         nd.extend([title, destRef])
         return destRef
+
+
+def _copyDirect(obj):
+    # Copies the direct dictionaries and arrays of an object, which the
+    # indirect references sweep rewrites in place, keeping the indirect
+    # references and the other objects as they are.
+    if isinstance(obj, StreamObject):
+        return obj
+    if isinstance(obj, DictionaryObject):
+        copy = DictionaryObject()
+        for key, value in obj.items():
+            copy[key] = _copyDirect(value)
+        return copy
+    if isinstance(obj, ArrayObject):
+        return ArrayObject([_copyDirect(value) for value in obj])
+    return obj
+
+
+def _copyPage(page):
+    # Copies a page, see _copyDirect, keeping its original reference and its
+    # pending transformations.
+    copy = PageObject(page.pdf, page.indirectRef)
+    for key, value in page.items():
+        copy[key] = _copyDirect(value)
+    copy._transformation = page._transformation
+    return copy
+
+
+def _byteWidth(value):
+    # Number of bytes of a field of a cross-reference stream holding value.
+    width = 1
+    while value >= 256 ** width:
+        width += 1
+    return width
+
+
+def _optimizeStreamData(task):
+    # Compresses the data of a stream, inflating it first if it is Flate
+    # encoded.  Returns None if the data is corrupted, truncated or exceeds
+    # the decode limits.  Runs in the workers of
+    # PdfFileWriter._optimizeStreams.
+    data, inflate, level, strategy, limits = task
+    if inflate:
+        try:
+            data = filters.decompress(data, limits)
+        except (zlib.error, PdfStreamError, PdfDecodeLimitError):
+            return None
+    return filters.compress(data, level, strategy)
+
+
+if __name__ == "__main__":
+    from reader import PdfFileReader
+
+    # a document read back, to be written in streaming mode
+    source = PdfFileWriter()
+    for text in ("first", "second"):
+        page = source.addBlankPage(200, 200)
+        font = DictionaryObject({NameObject("/Type"): NameObject("/Font"),
+                                 NameObject("/Subtype"): NameObject("/Type1"),
+                                 NameObject("/BaseFont"):
+                                     NameObject("/Helvetica")})
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({
+                NameObject("/F1"): source._addObject(font)})})
+        page[NameObject("/Contents")] = source._addObject(
+            PageObject._dataStream("BT /F1 12 Tf (%s) Tj ET" % text))
+    data = StringIO()
+    source.write(data)
+    reader = PdfFileReader(StringIO(data.getvalue()))
+
+    # the pages of the reader are left usable by the writers, and can be
+    # written again
+    for i in xrange(2):
+        output = StringIO()
+        writer = PdfFileWriter()
+        writer.open(output)
+        for page in reader.pages:
+            writer.addPage(page)
+        writer.close()
+        assert reader.getPage(0).extractText() == "first"
+        copy = PdfFileReader(StringIO(output.getvalue()))
+        assert [page.extractText() for page in copy.pages] == \
+            ["first", "second"]